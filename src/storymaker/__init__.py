@@ -1,6 +1,7 @@
 import argparse
-from .create_story import main as create_story_main
-from .create_character import main as create_character_main
+
+# Subcommand modules are imported only when they run, so `storymaker --help`
+# and light subcommands such as `report` do not pay for openai and friends.
 
 
 def main():
@@ -42,12 +43,114 @@ def main():
     story_parser.add_argument(
         "--genre", "-g", type=str, required=False, help=("Genre of the story.")
     )
+    story_parser.add_argument(
+        "--resume", action="store_true", help=("Resume from the last completed stage in the output directory.")
+    )
+
+    # Subcommand for batch
+    batch_parser = subparsers.add_parser("batch", help="Create many stories concurrently")
+    batch_parser.add_argument(
+        "-i", "--input", type=str, required=True, help="Directory of character files or a JSONL manifest"
+    )
+    batch_parser.add_argument(
+        "-o", "--output_dir", type=str, required=True, help="Root output directory, one subdirectory per job"
+    )
+    batch_parser.add_argument(
+        "-m", "--manuscript", type=str, required=False, help=("Manuscript file." 
+                            "This file contains the model name for each step.")
+    )
+    batch_parser.add_argument(
+        "-e", "--env", type=str, required=False, help=("Environment file." 
+                            "This file contains the model name for each step.")
+    )
+    batch_parser.add_argument(
+        "--genre", "-g", type=str, required=False, help=("Genre of the stories.")
+    )
+    batch_parser.add_argument(
+        "--concurrency", "-c", type=int, required=False, help=("Maximum number of concurrent stories.")
+    )
+    batch_parser.add_argument(
+        "--resume", action="store_true", help=("Resume every job from its last completed stage.")
+    )
 
-    args = parser.parse_args()
+    # Subcommand for character-batch
+    # Its options are parsed by storymaker.character_batch itself (see storymaker character-batch --help).
+    subparsers.add_parser(
+        "character-batch", help="Create characters for many news items concurrently", add_help=False
+    )
+
+    # Subcommand for report
+    report_parser = subparsers.add_parser("report", help="Summarize latency and token usage of past runs")
+    report_parser.add_argument(
+        "paths", nargs="+", help=("Run report files or output directories searched for run_report.json.")
+    )
+
+    # Subcommand for bench
+    # Its options are parsed by storymaker.benchmark itself (see storymaker bench --help).
+    subparsers.add_parser("bench", help="Benchmark the pipelines offline against a local mock server", add_help=False)
+
+    # Subcommand for worker
+    # Its options are parsed by storymaker.worker itself (see storymaker worker --help).
+    subparsers.add_parser("worker", help="Serve story and character jobs from a local queue", add_help=False)
+
+    # Subcommand for corpus
+    # Its options are parsed by storymaker.corpus itself (see storymaker corpus --help).
+    subparsers.add_parser("corpus", help="Index generated stories and look up near-duplicates", add_help=False)
+
+    args, extra_args = parser.parse_known_args()
+    if extra_args and args.command not in ("character-batch", "bench", "worker", "corpus"):
+        parser.error(f"unrecognized arguments: {' '.join(extra_args)}")
 
     if args.command == "character":
-        create_character_main(["--input", args.input, "--output", args.output, "--manuscript", args.manuscript, "--env", args.env, "--genre", args.genre])
+        from .create_character import main as create_character_main
+
+        character_args = ["--input", args.input, "--output", args.output]
+        for option in ("manuscript", "env", "genre"):
+            value = getattr(args, option)
+            if value is not None:
+                character_args += [f"--{option}", value]
+        create_character_main(character_args)
     elif args.command == "story":
-        create_story_main(["--input", args.input, "--output_dir", args.output_dir, "--manuscript", args.manuscript, "--env", args.env, "--genre", args.genre])
+        from .create_story import main as create_story_main
+
+        story_args = ["--input", args.input, "--output_dir", args.output_dir]
+        for option in ("manuscript", "env", "genre"):
+            value = getattr(args, option)
+            if value is not None:
+                story_args += [f"--{option}", value]
+        if args.resume:
+            story_args.append("--resume")
+        create_story_main(story_args)
+    elif args.command == "batch":
+        from .batch import main as batch_main
+
+        batch_args = ["--input", args.input, "--output_dir", args.output_dir]
+        for option in ("manuscript", "env", "genre", "concurrency"):
+            value = getattr(args, option)
+            if value is not None:
+                batch_args += [f"--{option}", str(value)]
+        if args.resume:
+            batch_args.append("--resume")
+        batch_main(batch_args)
+    elif args.command == "character-batch":
+        from .character_batch import main as character_batch_main
+
+        character_batch_main(extra_args)
+    elif args.command == "report":
+        from .metrics import main as report_main
+
+        report_main(args.paths)
+    elif args.command == "bench":
+        from .benchmark import main as benchmark_main
+
+        benchmark_main(extra_args)
+    elif args.command == "worker":
+        from .worker import main as worker_main
+
+        worker_main(extra_args)
+    elif args.command == "corpus":
+        from .corpus import main as corpus_main
+
+        corpus_main(extra_args)
     else:
         parser.print_help()
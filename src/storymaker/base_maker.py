@@ -1,81 +1,455 @@
 """Base class for all makers."""
 
-import openai
+import os
+import time
+import asyncio
 import logging
+import warnings
+import functools
+from collections import deque
+
+import openai
 
-from storymaker.utils import load_api_key, read_prompt, load_markdown_as_prompt, load_manuscript
+from storymaker.utils import load_api_key, load_manuscript, run_sync, count_tokens_batch
+from storymaker.cache import cache_key, load_response_cache
+from storymaker.clients import get_async_client
+from storymaker.scheduler import get_scheduler
+from storymaker.metrics import CallMetrics
+from storymaker.budget import TokenBudget
+from storymaker.deferred import get_deferred_batcher, parse_completion
+from storymaker.hedging import hedge_delay, record_latency, run_hedged
 
 BASE_MAX_COMPLETION_TOKENS = 100000
+DEFAULT_RESPONSE_HISTORY_SIZE = 100
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.INFO)
 
+
+def log_prompt_cache_usage(call_metrics: CallMetrics) -> None:
+    if call_metrics.cached_tokens and call_metrics.prompt_tokens:
+        logger.info(
+            f"Prompt cache: {call_metrics.cached_tokens}/{call_metrics.prompt_tokens} prompt tokens cached "
+            f"({call_metrics.cached_tokens / call_metrics.prompt_tokens:.0%})."
+        )
+
+
 class BaseMaker:
     def __init__(self, manuscript_path: str, env_path: str) -> None:
         self.env_path = env_path
         self.manuscript = load_manuscript(manuscript_path)
-        
+
         if not "api_base_path" in self.manuscript:
             raise ValueError("api_base_path is not set in manuscript.")
-        
-        self.client = openai.OpenAI(api_key=load_api_key(env_path), base_url=self.manuscript["api_base_path"])
-        self.responses = []
 
-    def create_chat_completion(self, prompt: str, system_prompt: str, **kwargs) -> str:
+        self.api_key = load_api_key(env_path)
+        self.cache = load_response_cache(self.manuscript.get("cache"))
+        self.scheduler = get_scheduler(
+            self.manuscript["api_base_path"], self.manuscript.get("rate_limits"), self.manuscript.get("retry")
+        )
+        self.budget = TokenBudget(self.manuscript)
+        # Compact records of the latest calls; full response objects are not retained.
+        self.responses = deque(maxlen=self.manuscript.get("response_history_size", DEFAULT_RESPONSE_HISTORY_SIZE))
+        self.hooks = []
+        self._client = None
+
+    def reset(self) -> None:
+        """Drop per-job state so a long-lived maker can be reused for the next job."""
+        self.responses.clear()
+
+    @property
+    def async_client(self) -> openai.AsyncOpenAI:
+        """Shared AsyncOpenAI client for the running event loop."""
+        return get_async_client(self.manuscript["api_base_path"], self.api_key, self.manuscript.get("http_client"))
+
+    @property
+    def client(self) -> openai.OpenAI:
+        """Synchronous client, kept for code written against the former ``maker.client`` attribute.
+
+        Deprecated: makers call the API through the shared ``async_client``;
+        use ``create_chat_completion`` or ``acreate_chat_completion`` instead.
+        """
+        warnings.warn(
+            "BaseMaker.client is deprecated; use create_chat_completion, acreate_chat_completion or async_client.",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        if self._client is None:
+            self._client = openai.OpenAI(api_key=self.api_key, base_url=self.manuscript["api_base_path"])
+        return self._client
+
+    def prompt_cache_control(self, step: str | None) -> dict | None:
+        """Cache-control hint for ``step`` from the manuscript's ``prompt_cache`` options, or None."""
+        options = self.manuscript.get("prompt_cache", {})
+        enabled = self.manuscript.get(step, {}).get("prompt_cache", options.get("enabled", False))
+        if not enabled:
+            return None
+        cache_control = {"type": "ephemeral"}
+        if "ttl" in options:
+            cache_control["ttl"] = options["ttl"]
+        return cache_control
+
+    def build_messages(self, prompt: str | list[str], system_prompt: str, step: str | None = None) -> list[dict]:
+        """System prompt first, then the user prompt segments, most stable first.
+
+        With prompt caching enabled for ``step``, the system prompt and every
+        user segment but the last carry a cache-control breakpoint, so the
+        provider can reuse the shared prefix across calls.
+        """
+        segments = [prompt] if isinstance(prompt, str) else list(prompt)
+        cache_control = self.prompt_cache_control(step)
+        if cache_control is None:
+            return [{"role": "system", "content": system_prompt}, {"role": "user", "content": "".join(segments)}]
+
+        system_content = [{"type": "text", "text": system_prompt, "cache_control": cache_control}]
+        user_content = []
+        for i, segment in enumerate(segments):
+            part = {"type": "text", "text": segment}
+            if i < len(segments) - 1:
+                part["cache_control"] = cache_control
+            user_content.append(part)
+        return [{"role": "system", "content": system_content}, {"role": "user", "content": user_content}]
+
+    def create_chat_completion(self, prompt: str | list[str], system_prompt: str, **kwargs) -> str:
+        return run_sync(self.acreate_chat_completion(prompt, system_prompt, **kwargs))
+
+    async def acreate_chat_completion(self, prompt: str | list[str], system_prompt: str, **kwargs) -> str:
+        """Create a chat completion for ``step`` (a manuscript section name).
+
+        ``prompt`` may be a list of segments, stable text first, to let the
+        provider cache the leading segments (see ``build_messages``).
+        ``cache_variant`` keeps otherwise identical requests, such as
+        candidate drafts, apart in the response cache. Steps marked
+        ``deferred`` in the manuscript go through the provider's Batch API;
+        the others may hedge over a fallback chain (see
+        ``_hedged_chat_completion``).
+        """
         logger.info("Creating chat completion...")
-        
-        if prompt in ("", None) and system_prompt in ("", None):
+
+        if not isinstance(prompt, str) and prompt is not None:
+            prompt = [segment for segment in prompt if segment]
+        if prompt in ("", None, []) and system_prompt in ("", None):
             raise ValueError("prompt or system_prompt is not set.")
-        
+
         if "temperature" not in kwargs:
             kwargs["temperature"] = 0.7
         if "top_p" not in kwargs:
             kwargs["top_p"] = 0.85
         if "max_completion_tokens" not in kwargs:
             kwargs["max_completion_tokens"] = BASE_MAX_COMPLETION_TOKENS
-            
+
         logger.info(f"input kwargs: {kwargs}")
-        
+
+        step = kwargs.get("step")
+        use_cache = self.cache is not None and self.manuscript.get(step, {}).get("cache", True)
+        stream = kwargs.get("stream", self.manuscript.get(step, {}).get("stream", False))
+        deferred = kwargs.get("deferred", self.manuscript.get(step, {}).get("deferred", False))
+
         response = None  # Initialize response variable
+        call_metrics = None
         try:
+            messages = self.build_messages(prompt or "", system_prompt, step)
             if "response_format" not in kwargs:
-                response_format = openai._types.NOT_GIVEN
-                response = self.client.chat.completions.create(
-                    model=kwargs.get("model", "gpt-5"),
-                    messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
-                    max_completion_tokens=kwargs.get("max_completion_tokens"),
-                    top_p=kwargs.get("top_p", 0.85),
-                    temperature=kwargs.get("temperature", 0.7),
-                    stream=False,
-                    reasoning_effort=kwargs.get("reasoning_effort", None),
-                )
+                response_format = openai.NOT_GIVEN
+                params = {
+                    "model": kwargs.get("model", "gpt-5"),
+                    "messages": messages,
+                    "max_completion_tokens": kwargs.get("max_completion_tokens"),
+                    "top_p": kwargs.get("top_p", 0.85),
+                    "temperature": kwargs.get("temperature", 0.7),
+                    "reasoning_effort": kwargs.get("reasoning_effort", None),
+                }
             else:
                 response_format = kwargs["response_format"]
-                print(response_format)
-                response = self.client.beta.chat.completions.parse(
-                    model=kwargs.get("model", "gpt-4.1"),
-                    messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
-                    max_completion_tokens=kwargs.get("max_completion_tokens"),
-                    top_p=kwargs.get("top_p", 0.0),
-                    temperature=kwargs.get("temperature", 0.0),
-                    response_format=response_format,
-                    reasoning_effort=kwargs.get("reasoning_effort", None),
+                params = {
+                    "model": kwargs.get("model", "gpt-4.1"),
+                    "messages": messages,
+                    "max_completion_tokens": kwargs.get("max_completion_tokens"),
+                    "top_p": kwargs.get("top_p", 0.0),
+                    "temperature": kwargs.get("temperature", 0.0),
+                    "response_format": response_format,
+                    "reasoning_effort": kwargs.get("reasoning_effort", None),
+                }
+
+            call_metrics = CallMetrics(step, params["model"], time.time())
+            model = params["model"]
+            prompt_text = prompt if isinstance(prompt, str) else "".join(prompt or [])
+            prompt_tokens = sum(count_tokens_batch([system_prompt or "", prompt_text], model))
+            requested_completion_tokens = params["max_completion_tokens"]
+            params["max_completion_tokens"] = await self.budget.acompletion_tokens(
+                step, model, prompt_tokens, requested_completion_tokens
+            )
+            logger.info(f"Prompt tokens: {prompt_tokens}, max_completion_tokens: {params['max_completion_tokens']}")
+
+            cache_variant = kwargs.get("cache_variant")
+            key = cache_key({**params, "cache_variant": cache_variant} if cache_variant else params)
+            if use_cache:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    logger.info(f"Using cached response for step {step}.")
+                    call_metrics.cache_hit = True
+                    if response_format is not openai.NOT_GIVEN:
+                        return response_format.model_validate_json(cached)
+                    return cached
+
+            def count_retry(error: Exception) -> None:
+                call_metrics.retries += 1
+
+            if deferred:
+                call_metrics.deferred = True
+                response = await self._deferred_chat_completion(params, key, response_format)
+            else:
+                stream = stream and response_format is openai.NOT_GIVEN
+                model, response = await self._hedged_chat_completion(
+                    params,
+                    prompt_tokens,
+                    requested_completion_tokens,
+                    stream,
+                    kwargs.get("stream_path"),
+                    call_metrics,
+                    count_retry,
                 )
-            
-            print(response)
-            self.responses.append(response)
+                if stream:
+                    result = response
+                    if use_cache:
+                        self.cache.set(key, result)
+                    return result
+
+            logger.debug(f"response: {response}")
+            call_metrics.response_id = response.id
+            call_metrics.finish_reason = response.choices[0].finish_reason if response.choices else None
+            call_metrics.record_usage(response.usage)
+            log_prompt_cache_usage(call_metrics)
+            if response.usage is not None and not deferred:
+                self.scheduler.record_usage(model, response.usage.completion_tokens)
 
-            if response_format is not openai._types.NOT_GIVEN:
-                return response.choices[0].message.parsed
+            if response_format is not openai.NOT_GIVEN:
+                result = response.choices[0].message.parsed
+                # None on a refusal or empty content: returned as is, but never cached.
+                if use_cache and result is not None:
+                    self.cache.set(key, result.model_dump_json())
+                return result
             else:
                 if response.choices[0].message.content == "":
                     raise ValueError("Response is ok but content is empty.")
 
-                return response.choices[0].message.content
-            
+                result = response.choices[0].message.content
+                if use_cache:
+                    self.cache.set(key, result)
+                return result
+
         except Exception as e:
             logger.error(f"Error creating chat completion: {e}")
             logger.error(f"input kwargs: {kwargs}")
             logger.error(f"response: {response}")
-            raise e
\ No newline at end of file
+            if call_metrics is not None:
+                call_metrics.ok = False
+                call_metrics.error = repr(e)
+            raise e
+        finally:
+            if call_metrics is not None:
+                call_metrics.wall_time = time.time() - call_metrics.started_at
+                self.emit_metrics(call_metrics)
+
+    def emit_metrics(self, call_metrics: CallMetrics) -> None:
+        self.responses.append(call_metrics)
+        for hook in self.hooks:
+            try:
+                hook.on_call(call_metrics)
+            except Exception as e:
+                logger.error(f"Error in metrics hook {hook}: {e}")
+
+    async def _hedged_chat_completion(
+        self,
+        params: dict,
+        prompt_tokens: int,
+        requested_completion_tokens: int,
+        stream: bool,
+        stream_path: str | None,
+        call_metrics: CallMetrics,
+        on_retry,
+    ) -> tuple[str, object]:
+        """Request the completion from the step's model, then from its fallbacks.
+
+        A step may declare ``fallbacks``, models asked in order when the ones
+        before them failed, and ``hedge`` (see ``storymaker.hedging.hedge_delay``)
+        to also ask the next one when none produced a first token in time.
+        The first to finish wins and the others are cancelled. Without
+        fallbacks a hedge repeats the request to the same model. Returns the
+        winning model and its streamed text or response.
+        """
+        step = call_metrics.step
+        hedge = self.manuscript.get(step, {}).get("hedge")
+        models = [params["model"]] + list(self.manuscript.get(step, {}).get("fallbacks", []))
+        if hedge is not None and len(models) == 1:
+            models.append(params["model"])
+
+        attempts = []
+        for model in models:
+            attempt_params = dict(params, model=model)
+            if model != params["model"]:
+                try:
+                    attempt_params["max_completion_tokens"] = await self.budget.acompletion_tokens(
+                        step, model, prompt_tokens, requested_completion_tokens
+                    )
+                except ValueError as e:
+                    logger.warning(f"Skipping fallback {model}: {e}")
+                    continue
+            attempts.append((attempt_params, CallMetrics(step, model, time.time())))
+
+        first_token = asyncio.Event()
+        calls = [
+            functools.partial(
+                self._request_chat_completion,
+                attempt_params,
+                prompt_tokens,
+                stream,
+                # Only the first request writes through; a winning hedge is written once it is done.
+                stream_path if i == 0 else None,
+                attempt_metrics,
+                on_retry,
+                first_token,
+            )
+            for i, (attempt_params, attempt_metrics) in enumerate(attempts)
+        ]
+        delays = [
+            None if hedge is None else hedge_delay(hedge, attempt_params["model"], step) for attempt_params, _ in attempts
+        ]
+        index, result, started = await run_hedged(calls, delays, first_token)
+
+        winner_params, winner_metrics = attempts[index]
+        call_metrics.model = winner_params["model"]
+        call_metrics.hedges = started - 1
+        if stream:
+            for name in ("ttft", "finish_reason", "response_id", "prompt_tokens", "completion_tokens",
+                         "reasoning_tokens", "cached_tokens", "cost"):
+                setattr(call_metrics, name, getattr(winner_metrics, name))
+            if index > 0 and stream_path is not None:
+                with open(stream_path, "w", encoding="utf-8") as f:
+                    f.write(result)
+        return winner_params["model"], result
+
+    async def _request_chat_completion(
+        self,
+        params: dict,
+        prompt_tokens: int,
+        stream: bool,
+        stream_path: str | None,
+        call_metrics: CallMetrics,
+        on_retry,
+        first_token: asyncio.Event,
+    ):
+        """Send one request and return the streamed text or the response.
+
+        ``first_token`` is set when the first token (or, when not streaming,
+        the response) arrives, and that latency is recorded for hedging. A
+        request cancelled before then records how long it had waited.
+        """
+        model = params["model"]
+        start = time.perf_counter()
+        try:
+            if stream:
+                result = await self.scheduler.run(
+                    model,
+                    prompt_tokens,
+                    lambda: self._stream_chat_completion(params, stream_path, call_metrics, first_token),
+                    on_retry,
+                )
+                record_latency(model, call_metrics.step, call_metrics.ttft)
+            else:
+                if "response_format" in params:
+                    create = lambda: self.async_client.beta.chat.completions.parse(**params)
+                else:
+                    create = lambda: self.async_client.chat.completions.create(**params, stream=False)
+                result = await self.scheduler.run(model, prompt_tokens, create, on_retry)
+                first_token.set()
+                record_latency(model, call_metrics.step, time.perf_counter() - start)
+            return result
+        except asyncio.CancelledError:
+            # A lower bound of the latency, so that cancelled slow requests still count in the histogram.
+            record_latency(model, call_metrics.step, call_metrics.ttft or time.perf_counter() - start)
+            raise
+
+    async def _deferred_chat_completion(self, params: dict, key: str, response_format):
+        """Send the request with the next provider batch and wait for its result.
+
+        Batched requests bypass the rate limits of the scheduler; see
+        ``storymaker.deferred`` for the batching options.
+        """
+        batcher = get_deferred_batcher(self.async_client, self.scheduler, self.manuscript.get("deferred"))
+        body = await batcher.complete(params, key)
+        if response_format is openai.NOT_GIVEN:
+            return openai.types.chat.ChatCompletion.model_validate(body)
+        return parse_completion(body, response_format)
+
+    async def _stream_chat_completion(
+        self,
+        params: dict,
+        stream_path: str | None = None,
+        call_metrics: CallMetrics | None = None,
+        first_token: asyncio.Event | None = None,
+    ) -> str:
+        """Stream a completion, writing chunks through to ``stream_path`` as they arrive.
+
+        Returns the assembled text and logs time-to-first-token and tokens/sec.
+        ``first_token`` is set when the first content arrives.
+        """
+        start = time.perf_counter()
+        first_token_at = None
+        usage_chunk = None
+        finish_reason = None
+        parts = []
+        output = None
+        if stream_path is not None:
+            dir_path = os.path.dirname(stream_path)
+            if dir_path and not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+            output = open(stream_path, "w", encoding="utf-8")
+        try:
+            stream = await self.async_client.chat.completions.create(
+                **params, stream=True, stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage_chunk = chunk
+                if chunk.choices and chunk.choices[0].finish_reason is not None:
+                    finish_reason = chunk.choices[0].finish_reason
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    logger.info(f"First token after {first_token_at - start:.2f}s.")
+                    if call_metrics is not None:
+                        call_metrics.ttft = first_token_at - start
+                    if first_token is not None:
+                        first_token.set()
+                parts.append(chunk.choices[0].delta.content)
+                if output is not None:
+                    output.write(chunk.choices[0].delta.content)
+                    output.flush()
+        finally:
+            if output is not None:
+                output.close()
+
+        if call_metrics is not None:
+            call_metrics.finish_reason = finish_reason
+        if usage_chunk is not None:
+            self.scheduler.record_usage(params["model"], usage_chunk.usage.completion_tokens)
+            if call_metrics is not None:
+                call_metrics.response_id = usage_chunk.id
+                call_metrics.record_usage(usage_chunk.usage)
+                log_prompt_cache_usage(call_metrics)
+        content = "".join(parts)
+        if content == "":
+            raise ValueError("Response is ok but content is empty.")
+
+        if first_token_at is not None and usage_chunk is not None:
+            generation_time = time.perf_counter() - first_token_at
+            completion_tokens = usage_chunk.usage.completion_tokens
+            tokens_per_second = completion_tokens / generation_time if generation_time > 0 else float("inf")
+            logger.info(
+                f"Streamed {completion_tokens} completion tokens in {time.perf_counter() - start:.2f}s "
+                f"(ttft={first_token_at - start:.2f}s, {tokens_per_second:.1f} tokens/sec)."
+            )
+        return content
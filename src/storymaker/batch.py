@@ -0,0 +1,173 @@
+"""Batch story generation over many character files."""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import logging
+from dataclasses import dataclass, field, asdict
+
+from storymaker.utils import load_markdown_as_prompt
+from storymaker.clients import closing_clients
+from storymaker.create_story import StoryMaker
+
+DEFAULT_CONCURRENCY = 4
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class BatchJob:
+    name: str
+    input_path: str
+    output_dir: str
+    kwargs: dict = field(default_factory=dict)
+    characters: str | None = None  # used instead of reading input_path when set
+
+
+@dataclass
+class BatchResult:
+    name: str
+    input_path: str
+    output_dir: str
+    ok: bool
+    elapsed: float
+    error: str | None = None
+
+
+def collect_jobs(input_path: str, output_root: str, **kwargs) -> list[BatchJob]:
+    """Build batch jobs from a directory of character files or a JSONL manifest.
+
+    A manifest line looks like ``{"input": "a.md", "name": "a", "genre": "..."}``;
+    only ``input`` is required and relative paths are resolved against the
+    manifest's directory. Every job writes into ``output_root/<name>``.
+    """
+    entries = []
+    if os.path.isdir(input_path):
+        for file_name in sorted(os.listdir(input_path)):
+            if file_name.endswith(".md"):
+                entries.append({"input": os.path.join(input_path, file_name)})
+    else:
+        base_dir = os.path.dirname(os.path.abspath(input_path))
+        with open(input_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                entry = json.loads(line)
+                if "input" not in entry:
+                    raise ValueError(f"Manifest entry has no input: {line.strip()}")
+                entry["input"] = os.path.join(base_dir, entry["input"])
+                entries.append(entry)
+
+    jobs = []
+    seen_names = set()
+    for entry in entries:
+        entry = dict(entry)
+        input_file = entry.pop("input")
+        name = unique_name(entry.pop("name", None) or os.path.splitext(os.path.basename(input_file))[0], seen_names)
+        job_kwargs = {**kwargs, **entry}
+        jobs.append(BatchJob(name, input_file, os.path.join(output_root, name), job_kwargs))
+    return jobs
+
+
+def unique_name(name: str, seen_names: set) -> str:
+    """``name``, or ``name-2``, ``name-3``... if already taken; the result is added to ``seen_names``."""
+    candidate = name
+    suffix = 2
+    while candidate in seen_names:
+        candidate = f"{name}-{suffix}"
+        suffix += 1
+    seen_names.add(candidate)
+    return candidate
+
+
+async def run_job(job: BatchJob, manuscript_path: str, env_path: str, resume: bool = False) -> BatchResult:
+    start = time.perf_counter()
+    try:
+        story_maker = StoryMaker(manuscript_path, env_path)
+        characters = job.characters if job.characters is not None else load_markdown_as_prompt(job.input_path)
+        await story_maker.aprocess_steps(characters, job.output_dir, resume, **job.kwargs)
+        return BatchResult(job.name, job.input_path, job.output_dir, True, time.perf_counter() - start)
+    except Exception as e:
+        logger.error(f"Batch job {job.name} failed: {e}")
+        return BatchResult(job.name, job.input_path, job.output_dir, False, time.perf_counter() - start, repr(e))
+
+
+async def run_batch(
+    jobs: list[BatchJob],
+    manuscript_path: str,
+    env_path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    resume: bool = False,
+) -> list[BatchResult]:
+    """Run story pipelines concurrently, at most ``concurrency`` at a time."""
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1.")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(job: BatchJob) -> BatchResult:
+        async with semaphore:
+            logger.info(f"Starting batch job {job.name}...")
+            result = await run_job(job, manuscript_path, env_path, resume)
+            logger.info(f"Batch job {job.name} finished in {result.elapsed:.1f}s (ok={result.ok}).")
+            return result
+
+    return await asyncio.gather(*(bounded(job) for job in jobs))
+
+
+def write_summary(results: list[BatchResult], file_name: str) -> dict:
+    summary = {
+        "total": len(results),
+        "succeeded": sum(1 for result in results if result.ok),
+        "failed": sum(1 for result in results if not result.ok),
+        "jobs": [asdict(result) for result in results],
+    }
+    dir_path = os.path.dirname(file_name)
+    if dir_path and not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    with open(file_name, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Create many stories at once")
+    parser.add_argument(
+        "--input", "-i", type=str, required=True, help="Directory of character files or a JSONL manifest"
+    )
+    parser.add_argument(
+        "--output_dir", "-o", type=str, required=True, help="Root output directory, one subdirectory per job"
+    )
+    parser.add_argument("--manuscript", "-m", type=str, required=False, help="Manuscript file")
+    parser.add_argument("--env", "-e", type=str, required=False, help="Environment file")
+    parser.add_argument("--genre", "-g", type=str, required=False, help="Genre of the stories")
+    parser.add_argument(
+        "--concurrency", "-c", type=int, default=DEFAULT_CONCURRENCY, help="Maximum number of concurrent stories"
+    )
+    parser.add_argument("--resume", action="store_true", help="Resume every job from its last completed stage")
+
+    if args is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(args)
+
+    kwargs = {}
+    if args.genre is not None:
+        kwargs["genre"] = args.genre
+
+    jobs = collect_jobs(args.input, args.output_dir, **kwargs)
+    results = asyncio.run(
+        closing_clients(run_batch(jobs, args.manuscript, args.env, args.concurrency, args.resume))
+    )
+    summary = write_summary(results, os.path.join(args.output_dir, "summary.json"))
+    logger.info(f"Batch finished: {summary['succeeded']} succeeded, {summary['failed']} failed.")
+    for result in results:
+        if not result.ok:
+            logger.info(f"  {result.name}: {result.error}")
+
+
+if __name__ == "__main__":
+    main()
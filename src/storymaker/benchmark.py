@@ -0,0 +1,213 @@
+"""Offline end-to-end benchmark of the pipelines against the local mock server."""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+import subprocess
+import tracemalloc
+
+import json5
+
+from storymaker import metrics
+from storymaker.batch import collect_jobs, run_batch
+from storymaker.clients import closing_clients
+from storymaker.create_character import CharacterMaker
+from storymaker.mock_server import MockServer, MockServerConfig
+
+BENCHMARK_MANUSCRIPT = {
+    "characters": {"model": "mock/characters", "temperature": 0.5, "top_p": 0.8},
+    "story": {"model": "mock/story", "temperature": 0.8, "top_p": 0.85, "reasoning_effort": "medium"},
+    "title_and_synopsis": {"model": "mock/title", "temperature": 0.6, "top_p": 0.6, "reasoning_effort": "medium"},
+    "enhance_story1": {"model": "mock/enhance", "temperature": 0.4, "top_p": 0.85, "reasoning_effort": "medium"},
+    "enhance_story2": {"model": "mock/enhance", "temperature": 0.3, "top_p": 0.85, "reasoning_effort": "medium"},
+    "frontmatter": {"model": "mock/frontmatter", "temperature": 0, "top_p": 0},
+    "retry": {"max_retries": 5, "base_delay": 0.05, "max_delay": 1},
+}
+
+# Fresh interpreters timed by bench_startup: the bare CLI, and the imports of a full pipeline.
+STARTUP_COMMANDS = {
+    "cli_help": "import sys; from storymaker import main; sys.argv = ['storymaker', '--help']; main()",
+    "import_pipeline": "import storymaker.create_story",
+}
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """``metrics.percentile``, or 0.0 for an empty list."""
+    return metrics.percentile(values, q) if values else 0.0
+
+
+def summarize_latencies(latencies: list[float], failures: int, elapsed: float) -> dict:
+    return {
+        "pipelines": len(latencies) + failures,
+        "failures": failures,
+        "elapsed": elapsed,
+        "throughput_per_s": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+    }
+
+
+async def bench_stories(manuscript_path: str, env_path: str, work_dir: str, count: int, concurrency: int) -> dict:
+    input_dir = os.path.join(work_dir, "characters")
+    os.makedirs(input_dir, exist_ok=True)
+    for i in range(count):
+        with open(os.path.join(input_dir, f"story{i:04d}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# 登場人物 {i}\n\n主人公は旅に出る。\n")
+    jobs = collect_jobs(input_dir, os.path.join(work_dir, "stories"), genre="ファンタジー")
+    start = time.perf_counter()
+    results = await run_batch(jobs, manuscript_path, env_path, concurrency)
+    elapsed = time.perf_counter() - start
+    latencies = [result.elapsed for result in results if result.ok]
+    return summarize_latencies(latencies, len(results) - len(latencies), elapsed)
+
+
+async def bench_characters(manuscript_path: str, env_path: str, work_dir: str, count: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i: int) -> float | None:
+        async with semaphore:
+            job_start = time.perf_counter()
+            try:
+                character_maker = CharacterMaker(manuscript_path, env_path)
+                output_path = os.path.join(work_dir, "characters_out", f"characters{i:04d}.md")
+                await character_maker.aprocess_steps(f"ニュース {i}", output_path, genre="ファンタジー")
+                return time.perf_counter() - job_start
+            except Exception as e:
+                logger.error(f"Character benchmark job {i} failed: {e}")
+                return None
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(run(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency in outcomes if latency is not None]
+    return summarize_latencies(latencies, len(outcomes) - len(latencies), elapsed)
+
+
+def bench_startup(runs: int) -> dict:
+    """Wall time of fresh interpreters running each of ``STARTUP_COMMANDS``."""
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])))
+    report = {}
+    for name, command in STARTUP_COMMANDS.items():
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", command], env=env, check=True, stdout=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        report[name] = {"runs": runs, "p50": percentile(timings, 50), "min": min(timings)}
+    return report
+
+
+def run_benchmark(
+    config: MockServerConfig, stories: int, characters: int, concurrency: int, manuscript: dict | None = None
+) -> dict:
+    """Run the pipelines against a fresh mock server and return the measurements."""
+    manuscript = dict(manuscript or BENCHMARK_MANUSCRIPT)
+    tracemalloc.start()
+    try:
+        with MockServer(config) as server, tempfile.TemporaryDirectory() as work_dir:
+            manuscript["api_base_path"] = server.base_url
+            manuscript_path = os.path.join(work_dir, "manuscript.json5")
+            with open(manuscript_path, "w", encoding="utf-8") as f:
+                json5.dump(manuscript, f)
+            env_path = os.path.join(work_dir, ".env")
+            with open(env_path, "w", encoding="utf-8") as f:
+                f.write("OPENROUTER_API_KEY=mock\n")
+
+            report = {"mock_server": vars(config), "concurrency": concurrency}
+            if characters > 0:
+                report["characters"] = asyncio.run(
+                    closing_clients(bench_characters(manuscript_path, env_path, work_dir, characters, concurrency))
+                )
+            if stories > 0:
+                report["stories"] = asyncio.run(
+                    closing_clients(bench_stories(manuscript_path, env_path, work_dir, stories, concurrency))
+                )
+            report["requests"] = server.request_count
+        report["peak_traced_memory_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+    return report
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipelines offline against a mock server")
+    parser.add_argument("--stories", type=int, default=20, help="Number of story pipelines")
+    parser.add_argument("--characters", type=int, default=20, help="Number of character pipelines")
+    parser.add_argument("--concurrency", "-c", type=int, default=8, help="Concurrent pipelines")
+    parser.add_argument("--manuscript", "-m", type=str, required=False, help="Manuscript to benchmark (api_base_path is replaced)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency before the first byte, in seconds")
+    parser.add_argument("--chunk-rate", type=float, default=200.0, help="Streamed chunks per second")
+    parser.add_argument("--chunk-size", type=int, default=20, help="Characters per streamed chunk")
+    parser.add_argument("--payload-size", type=int, default=4000, help="Characters per generated completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of injected errors")
+    parser.add_argument("--seed", type=int, required=False, help="Seed for error injection")
+    parser.add_argument("--output", "-o", type=str, required=False, help="Write the report as JSON to this file")
+    parser.add_argument("--max-p99", type=float, required=False, help="Fail if any pipeline p99 latency exceeds this")
+    parser.add_argument("--min-throughput", type=float, required=False, help="Fail if any pipeline throughput is below this")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters timed for CLI startup")
+    parser.add_argument("--max-startup", type=float, required=False, help="Fail if the p50 CLI startup exceeds this")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Keep the pipelines' info logs")
+
+    if args is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(args)
+
+    config = MockServerConfig(
+        latency=args.latency,
+        chunk_rate=args.chunk_rate,
+        chunk_size=args.chunk_size,
+        payload_size=args.payload_size,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    manuscript = None
+    if args.manuscript is not None:
+        with open(args.manuscript, "r") as f:
+            manuscript = json5.load(f)
+
+    if not args.verbose:
+        for name in list(logging.root.manager.loggerDict):
+            if name.startswith("storymaker"):
+                logging.getLogger(name).setLevel(logging.WARNING)
+    report = run_benchmark(config, args.stories, args.characters, args.concurrency, manuscript)
+    if args.startup_runs > 0:
+        report["startup"] = bench_startup(args.startup_runs)
+    report_text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(report_text)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report_text)
+
+    violations = []
+    for name in ("characters", "stories"):
+        if name not in report:
+            continue
+        if report[name]["failures"] > 0:
+            violations.append(f"{name}: {report[name]['failures']} pipelines failed")
+        if args.max_p99 is not None and report[name]["latency_p99"] > args.max_p99:
+            violations.append(f"{name}: p99 {report[name]['latency_p99']:.3f}s > {args.max_p99}s")
+        if args.min_throughput is not None and report[name]["throughput_per_s"] < args.min_throughput:
+            violations.append(f"{name}: throughput {report[name]['throughput_per_s']:.2f}/s < {args.min_throughput}/s")
+    if args.max_startup is not None and "startup" in report and report["startup"]["cli_help"]["p50"] > args.max_startup:
+        violations.append(f"startup: p50 {report['startup']['cli_help']['p50']:.3f}s > {args.max_startup}s")
+    if violations:
+        for violation in violations:
+            print(f"Benchmark gate failed: {violation}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
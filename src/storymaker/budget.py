@@ -0,0 +1,166 @@
+"""Per-stage completion token budgets from manuscript policies and model context windows."""
+
+import json
+import math
+import time
+import asyncio
+import logging
+import functools
+
+from storymaker import metrics
+
+# Context windows (prompt + completion tokens) of known models; extend or override
+# them with the manuscript's "context_windows" section.
+DEFAULT_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "o1": 200000,
+    "o1-mini": 128000,
+    "o3": 200000,
+    "gpt-5": 400000,
+    "gpt-5-mini": 400000,
+    "gpt-5.1": 400000,
+    "gpt-5.2": 400000,
+    "gemini-2.5-pro": 1048576,
+    "gemini-2.5-pro-preview": 1048576,
+    "gemini-3-pro-preview": 1048576,
+    "gemini-3-flash-preview": 1048576,
+    "deepseek-r1": 128000,
+    "deepseek-chat": 128000,
+}
+DEFAULT_LEARNED_PERCENTILE = 95
+DEFAULT_LEARNED_MARGIN = 1.2
+DEFAULT_LEARNED_MIN_SAMPLES = 5
+LEARNED_REFRESH_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+def learned_completion_ratio(history: tuple[str, ...], step: str, percentile: float) -> tuple[float | None, int]:
+    """Percentile of completion/prompt token ratios of ``step`` in past run reports, and the sample count.
+
+    The reports are read again at most every ``LEARNED_REFRESH_SECONDS``.
+    """
+    return _learned_completion_ratio(history, step, percentile, int(time.time() // LEARNED_REFRESH_SECONDS))
+
+
+@functools.lru_cache(maxsize=32)
+def _learned_completion_ratio(
+    history: tuple[str, ...], step: str, percentile: float, refresh_bucket: int
+) -> tuple[float | None, int]:
+    ratios = []
+    for report in metrics.find_reports(list(history)):
+        with open(report, "r", encoding="utf-8") as f:
+            calls = json.load(f)["calls"]
+        for call in calls:
+            if call["step"] != step or not call["ok"] or call["cache_hit"]:
+                continue
+            if call.get("prompt_tokens") and call.get("completion_tokens"):
+                ratios.append(call["completion_tokens"] / call["prompt_tokens"])
+    if not ratios:
+        return None, 0
+    return metrics.percentile(ratios, percentile), len(ratios)
+
+
+class TokenBudget:
+    """Sizes ``max_completion_tokens`` per call.
+
+    A manuscript step may declare a ``budget`` policy::
+
+        "frontmatter": {"budget": {"policy": "fixed", "max_completion_tokens": 8000}},
+        "enhance_story1": {"budget": {"policy": "ratio", "ratio": 3, "min": 20000, "max": 200000}},
+        "enhance_story2": {"budget": {"policy": "learned", "history": ["output"], "percentile": 95,
+                                      "margin": 1.2, "min": 20000, "max": 200000}},
+
+    ``ratio`` multiplies the prompt tokens. ``learned`` does the same with the
+    given percentile of the completion/prompt ratios recorded for the step in
+    past run reports, times ``margin``; it falls back to the caller's budget
+    until ``min_samples`` calls are recorded. Without a policy the caller's
+    budget is used. Every budget is then capped by what is left of the model's
+    context window after the prompt.
+    """
+
+    def __init__(self, manuscript: dict) -> None:
+        self.manuscript = manuscript
+        self.context_windows = {**DEFAULT_CONTEXT_WINDOWS, **manuscript.get("context_windows", {})}
+
+    def context_window(self, model: str) -> int | None:
+        if model in self.context_windows:
+            return self.context_windows[model]
+        # OpenRouter ids look like "openai/gpt-4o"; the defaults use the bare name.
+        return self.context_windows.get(model.split("/")[-1])
+
+    def learned_ratio(self, policy: dict, step: str | None) -> tuple[float | None, int]:
+        history = policy.get("history", [])
+        if isinstance(history, str):
+            history = [history]
+        percentile = policy.get("percentile", DEFAULT_LEARNED_PERCENTILE)
+        if not 0 <= percentile <= 100:
+            raise ValueError(f"Budget percentile of step {step} must be between 0 and 100, got {percentile}.")
+        return learned_completion_ratio(tuple(history), step, percentile)
+
+    def policy_budget(
+        self,
+        policy: dict,
+        step: str | None,
+        prompt_tokens: int,
+        default: int,
+        learned: tuple[float | None, int] | None = None,
+    ) -> int:
+        """Budget of ``policy``; ``learned`` is the step's ``learned_ratio`` when the caller already has it."""
+        name = policy.get("policy", "fixed")
+        if name == "fixed":
+            budget = policy.get("max_completion_tokens", default)
+        elif name == "ratio":
+            budget = math.ceil(policy["ratio"] * prompt_tokens)
+        elif name == "learned":
+            ratio, samples = learned if learned is not None else self.learned_ratio(policy, step)
+            if ratio is None or samples < policy.get("min_samples", DEFAULT_LEARNED_MIN_SAMPLES):
+                logger.info(f"Only {samples} recorded calls of step {step}, using the default budget.")
+                budget = default
+            else:
+                budget = math.ceil(ratio * prompt_tokens * policy.get("margin", DEFAULT_LEARNED_MARGIN))
+        else:
+            raise ValueError(f"Unknown budget policy {name} for step {step}.")
+        if "min" in policy:
+            budget = max(budget, policy["min"])
+        if "max" in policy:
+            budget = min(budget, policy["max"])
+        return budget
+
+    def completion_tokens(
+        self,
+        step: str | None,
+        model: str,
+        prompt_tokens: int,
+        default: int,
+        learned: tuple[float | None, int] | None = None,
+    ) -> int:
+        """``max_completion_tokens`` for a call of ``step`` with ``prompt_tokens`` of input.
+
+        Raises ValueError when the prompt alone does not fit the context window.
+        """
+        policy = self.manuscript.get(step, {}).get("budget")
+        budget = default if policy is None else self.policy_budget(policy, step, prompt_tokens, default, learned)
+        window = self.context_window(model)
+        if window is not None:
+            available = window - prompt_tokens
+            if available <= 0:
+                raise ValueError(f"Prompt of {prompt_tokens} tokens exceeds the {window}-token context window of {model}.")
+            budget = min(budget, available)
+        return budget
+
+    async def acompletion_tokens(self, step: str | None, model: str, prompt_tokens: int, default: int) -> int:
+        """``completion_tokens`` that reads the run reports of a ``learned`` policy in a worker thread.
+
+        Scanning a large output history would otherwise block every other
+        pipeline and stream on the event loop.
+        """
+        policy = self.manuscript.get(step, {}).get("budget")
+        learned = None
+        if policy is not None and policy.get("policy") == "learned":
+            learned = await asyncio.to_thread(self.learned_ratio, policy, step)
+        return self.completion_tokens(step, model, prompt_tokens, default, learned)
@@ -0,0 +1,137 @@
+"""On-disk cache for chat completion responses."""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+DEFAULT_CACHE_PATH = ".storymaker_cache/responses.sqlite3"
+DEFAULT_MAX_SIZE_MB = 512
+DEFAULT_MAX_AGE_DAYS = 30
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+def cache_key(params: dict) -> str:
+    """Content hash of a chat completion request.
+
+    ``params`` are the keyword arguments sent to the API. A pydantic
+    ``response_format`` is hashed by its JSON schema.
+    """
+    hashable = dict(params)
+    response_format = hashable.get("response_format")
+    if response_format is not None and hasattr(response_format, "model_json_schema"):
+        hashable["response_format"] = response_format.model_json_schema()
+    payload = json.dumps(hashable, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Interface of a response cache. Subclass it to plug in another store."""
+
+    def get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+
+class SQLiteResponseCache(ResponseCache):
+    """Response cache stored in a single SQLite file.
+
+    Entries older than ``max_age_days`` are dropped, and the least recently
+    used entries are evicted once the stored payloads exceed ``max_size_mb``.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_size_mb: float = DEFAULT_MAX_SIZE_MB,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+    ) -> None:
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.max_age_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_seconds,))
+        (total_size,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total_size <= self.max_size_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+        logger.info(f"Evicted cached responses down to {total_size} bytes.")
+
+
+def load_response_cache(config: dict | bool | None) -> ResponseCache | None:
+    """Build the cache described by the manuscript's ``cache`` section.
+
+    ``true`` enables the default SQLite cache; a dict may set ``path``,
+    ``max_size_mb``, ``max_age_days`` and ``enabled``.
+    """
+    if config in (None, False):
+        return None
+    if config is True:
+        config = {}
+    if not config.get("enabled", True):
+        return None
+    return SQLiteResponseCache(
+        path=config.get("path", DEFAULT_CACHE_PATH),
+        max_size_mb=config.get("max_size_mb", DEFAULT_MAX_SIZE_MB),
+        max_age_days=config.get("max_age_days", DEFAULT_MAX_AGE_DAYS),
+    )
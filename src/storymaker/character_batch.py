@@ -0,0 +1,241 @@
+"""Bulk character generation over many news items, optionally chained into stories."""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+
+from storymaker.genre import GENRE_LIST
+from storymaker.utils import load_markdown_as_prompt
+from storymaker.clients import closing_clients
+from storymaker.create_character import CharacterMaker
+from storymaker.batch import DEFAULT_CONCURRENCY, BatchJob, run_job, unique_name
+from storymaker.similarity import DEFAULT_SIMILARITY_THRESHOLD, find_duplicates
+
+INDEX_FILE_NAME = "index.jsonl"
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class NewsItem:
+    name: str
+    news: str
+    input_path: str | None = None
+    kwargs: dict = field(default_factory=dict)
+
+
+@dataclass
+class CharacterResult:
+    name: str
+    input_path: str | None
+    output_path: str | None
+    ok: bool
+    elapsed: float
+    genre: str | None = None
+    duplicate_of: str | None = None
+    story_output_dir: str | None = None
+    story_ok: bool | None = None
+    error: str | None = None
+
+
+def collect_news_items(input_path: str, **kwargs) -> list[NewsItem]:
+    """Read news items from a directory of ``.md``/``.txt`` files or a JSONL file.
+
+    A JSONL line is ``{"news": "...", "name": "...", "genre": "..."}`` or
+    ``{"input": "news.md", ...}``; relative inputs are resolved against the
+    JSONL file's directory and the other keys become pipeline options.
+    """
+    entries = []
+    if os.path.isdir(input_path):
+        for file_name in sorted(os.listdir(input_path)):
+            if file_name.endswith((".md", ".txt")):
+                entries.append({"input": os.path.join(input_path, file_name)})
+    else:
+        base_dir = os.path.dirname(os.path.abspath(input_path))
+        with open(input_path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip() == "":
+                    continue
+                entry = json.loads(line)
+                if "news" not in entry and "input" not in entry:
+                    raise ValueError(f"News item has neither news nor input: {line.strip()}")
+                if "input" in entry:
+                    entry["input"] = os.path.join(base_dir, entry["input"])
+                entry.setdefault("name", f"news{line_number:05d}")
+                entries.append(entry)
+
+    items = []
+    seen_names = set()
+    for entry in entries:
+        entry = dict(entry)
+        item_input = entry.pop("input", None)
+        news = entry.pop("news", None)
+        if news is None:
+            news = load_markdown_as_prompt(item_input)
+        name = entry.pop("name", None) or os.path.splitext(os.path.basename(item_input))[0]
+        items.append(NewsItem(unique_name(name, seen_names), news, item_input, {**kwargs, **entry}))
+    return items
+
+
+class ResultIndex:
+    """Appends one JSON line per finished item, so the index grows while the run is in progress."""
+
+    def __init__(self, file_name: str) -> None:
+        dir_path = os.path.dirname(file_name)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self._file = open(file_name, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, result: CharacterResult) -> None:
+        with self._lock:
+            self._file.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+async def run_character_batch(
+    items: list[NewsItem],
+    output_root: str,
+    manuscript_path: str,
+    env_path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    chain_stories: bool = False,
+) -> list[CharacterResult]:
+    """Create characters for every distinct news item, at most ``concurrency`` at a time.
+
+    Items identical or near-identical (shingle similarity at least
+    ``similarity_threshold``) to an earlier item are not sent; their index
+    entry points at the earlier item instead. Each characters file is written
+    to ``output_root/characters/<name>.md`` as soon as it is ready. With
+    ``chain_stories`` the characters go straight into a story pipeline
+    writing to ``output_root/stories/<name>``.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1.")
+    semaphore = asyncio.Semaphore(concurrency)
+    index = ResultIndex(os.path.join(output_root, INDEX_FILE_NAME))
+    duplicate_of = find_duplicates([item.news for item in items], similarity_threshold)
+
+    async def run(item: NewsItem) -> CharacterResult:
+        kwargs = dict(item.kwargs)
+        # Pick the genre here so that a chained story uses the same one.
+        kwargs.setdefault("genre", random.choice(GENRE_LIST))
+        output_path = os.path.join(output_root, "characters", f"{item.name}.md")
+        async with semaphore:
+            logger.info(f"Starting character job {item.name}...")
+            start = time.perf_counter()
+            try:
+                character_maker = CharacterMaker(manuscript_path, env_path)
+                characters = await character_maker.aprocess_steps(item.news, output_path, **kwargs)
+                result = CharacterResult(item.name, item.input_path, output_path, True, 0.0, kwargs["genre"])
+            except Exception as e:
+                logger.error(f"Character job {item.name} failed: {e}")
+                result = CharacterResult(
+                    item.name, item.input_path, None, False, 0.0, kwargs["genre"], error=repr(e)
+                )
+            if result.ok and chain_stories:
+                story_job = BatchJob(
+                    item.name,
+                    output_path,
+                    os.path.join(output_root, "stories", item.name),
+                    {key: value for key, value in kwargs.items() if key != "language"},
+                    characters,
+                )
+                story_result = await run_job(story_job, manuscript_path, env_path)
+                result.story_output_dir = story_job.output_dir
+                result.story_ok = story_result.ok
+                result.error = story_result.error
+            result.elapsed = time.perf_counter() - start
+        index.write(result)
+        return result
+
+    try:
+        unique_items = [item for item, duplicate in zip(items, duplicate_of) if duplicate is None]
+        results = {result.name: result for result in await asyncio.gather(*(run(item) for item in unique_items))}
+        for item, duplicate in zip(items, duplicate_of):
+            if duplicate is None:
+                continue
+            original = results[items[duplicate].name]
+            results[item.name] = CharacterResult(
+                item.name,
+                item.input_path,
+                original.output_path,
+                original.ok,
+                0.0,
+                original.genre,
+                duplicate_of=original.name,
+                story_output_dir=original.story_output_dir,
+                story_ok=original.story_ok,
+            )
+            index.write(results[item.name])
+    finally:
+        index.close()
+    skipped = sum(1 for duplicate in duplicate_of if duplicate is not None)
+    if skipped:
+        logger.info(f"Skipped {skipped} duplicate news items.")
+    return [results[item.name] for item in items]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Create characters for many news items at once")
+    parser.add_argument(
+        "--input", "-i", type=str, required=True, help="Directory of news files or a JSONL file of news items"
+    )
+    parser.add_argument(
+        "--output_dir", "-o", type=str, required=True, help="Root output directory for characters and the index"
+    )
+    parser.add_argument("--manuscript", "-m", type=str, required=False, help="Manuscript file")
+    parser.add_argument("--env", "-e", type=str, required=False, help="Environment file")
+    parser.add_argument("--genre", "-g", type=str, required=False, help="Genre of the stories")
+    parser.add_argument(
+        "--concurrency", "-c", type=int, default=DEFAULT_CONCURRENCY, help="Maximum number of concurrent jobs"
+    )
+    parser.add_argument(
+        "--similarity",
+        type=float,
+        default=DEFAULT_SIMILARITY_THRESHOLD,
+        help="Shingle similarity from which a news item counts as a duplicate",
+    )
+    parser.add_argument("--stories", action="store_true", help="Also create a story from every characters file")
+
+    if args is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(args)
+
+    kwargs = {}
+    if args.genre is not None:
+        kwargs["genre"] = args.genre
+
+    items = collect_news_items(args.input, **kwargs)
+    results = asyncio.run(
+        closing_clients(
+            run_character_batch(
+                items, args.output_dir, args.manuscript, args.env, args.concurrency, args.similarity, args.stories
+            )
+        )
+    )
+    succeeded = sum(1 for result in results if result.ok and result.duplicate_of is None)
+    failed = sum(1 for result in results if not result.ok and result.duplicate_of is None)
+    duplicates = sum(1 for result in results if result.duplicate_of is not None)
+    logger.info(f"Characters finished: {succeeded} succeeded, {failed} failed, {duplicates} duplicates skipped.")
+    if args.stories:
+        stories = [result for result in results if result.story_ok is not None and result.duplicate_of is None]
+        story_failed = sum(1 for result in stories if not result.story_ok)
+        logger.info(f"Stories finished: {len(stories) - story_failed} succeeded, {story_failed} failed.")
+
+
+if __name__ == "__main__":
+    main()
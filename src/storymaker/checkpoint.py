@@ -0,0 +1,66 @@
+"""Per-stage checkpoints so an interrupted pipeline can be resumed."""
+
+import os
+import json
+import shutil
+import logging
+
+CHECKPOINT_DIR_NAME = "checkpoints"
+STATE_FILE_NAME = "state.json"
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+class PipelineCheckpoint:
+    """Stage outputs of one pipeline run, stored under ``<output_dir>/checkpoints``.
+
+    Without ``resume`` the previous checkpoints are discarded. With ``resume``
+    every stage whose checkpoint exists is loaded instead of recomputed, until
+    the first missing stage; from there on all stages run again, so a stale
+    later checkpoint is never mixed with fresh earlier output.
+    """
+
+    def __init__(self, output_dir: str, resume: bool = False) -> None:
+        self.dir_path = os.path.join(output_dir, CHECKPOINT_DIR_NAME)
+        self.resume = resume
+        if not resume and os.path.exists(self.dir_path):
+            shutil.rmtree(self.dir_path)
+        os.makedirs(self.dir_path, exist_ok=True)
+        self.state = {}
+        state_path = os.path.join(self.dir_path, STATE_FILE_NAME)
+        if resume and os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def _stage_path(self, stage: str) -> str:
+        return os.path.join(self.dir_path, f"{stage}.txt")
+
+    def _write(self, path: str, text: str) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def load(self, stage: str) -> str | None:
+        """Return the checkpointed output of ``stage``, or None if it must run."""
+        if not self.resume:
+            return None
+        path = self._stage_path(stage)
+        if not os.path.exists(path):
+            self.resume = False
+            return None
+        logger.info(f"Resuming from checkpoint of stage {stage}.")
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def save(self, stage: str, text: str) -> None:
+        self._write(self._stage_path(stage), text)
+
+    def get(self, name: str, default=None):
+        return self.state.get(name, default)
+
+    def set(self, name: str, value) -> None:
+        self.state[name] = value
+        self._write(os.path.join(self.dir_path, STATE_FILE_NAME), json.dumps(self.state, ensure_ascii=False))
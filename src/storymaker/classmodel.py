@@ -26,5 +26,18 @@ class NovelFrontmatter(BaseModel):
     )
 
 
+class DraftScore(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    candidate: int = Field(description="number of the candidate plot, starting from 1.")
+    score: int = Field(description="score of the candidate plot from 1 (weak) to 10 (excellent).")
+
+
+class DraftScores(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    scores: list[DraftScore] = Field(description="one score for every candidate plot.")
+
+
 if __name__ == "__main__":
     print(NovelFrontmatter.model_json_schema())
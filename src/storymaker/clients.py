@@ -0,0 +1,93 @@
+"""Process-wide registry of API clients shared by all makers."""
+
+import asyncio
+import logging
+import threading
+import weakref
+from collections.abc import Awaitable
+from typing import TypeVar
+
+import httpx
+import openai
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+CLOSE_TIMEOUT = 5.0
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+# event loop -> {(base_url, api_key, options): client}
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+
+def _build_http_client(options: dict) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=options.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+        max_keepalive_connections=options.get("max_keepalive_connections", DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+        keepalive_expiry=options.get("keepalive_expiry", DEFAULT_KEEPALIVE_EXPIRY),
+    )
+    timeout = httpx.Timeout(
+        options.get("timeout", DEFAULT_TIMEOUT), connect=options.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)
+    )
+    return openai.DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+
+
+def get_async_client(base_url: str, api_key: str | None, options: dict | None = None) -> openai.AsyncOpenAI:
+    """Return the shared AsyncOpenAI client for ``base_url`` and ``api_key``.
+
+    Clients are created once per event loop (an async connection pool cannot
+    outlive its loop) and reused by every maker, which keeps HTTP keep-alive
+    and TLS sessions warm. ``options`` is the manuscript's ``http_client``
+    section: ``max_connections``, ``max_keepalive_connections``,
+    ``keepalive_expiry``, ``timeout`` and ``connect_timeout``.
+    """
+    options = options or {}
+    loop = asyncio.get_running_loop()
+    key = (base_url, api_key, tuple(sorted(options.items())))
+    with _async_clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            logger.info(f"Creating shared API client for {base_url}.")
+            # Retries are handled by storymaker.scheduler, which also honors the rate limits.
+            client = openai.AsyncOpenAI(
+                api_key=api_key, base_url=base_url, max_retries=0, http_client=_build_http_client(options)
+            )
+            clients[key] = client
+        return client
+
+
+async def aclose_clients() -> None:
+    """Close the shared clients of the running event loop.
+
+    ``asyncio.run`` does not close them when its loop ends, which leaks their
+    connection pools; wrap the main coroutine in ``closing_clients`` or await
+    this before the loop finishes. A later ``get_async_client`` on the same
+    loop creates new clients.
+    """
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.pop(loop, {})
+    results = await asyncio.gather(*(client.close() for client in clients.values()), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"Error closing API client: {result}")
+
+
+async def closing_clients(awaitable: Awaitable[T]) -> T:
+    """Await ``awaitable``, then close the shared clients of the event loop::
+
+        asyncio.run(closing_clients(run_batch(jobs, "manuscript.json5", ".env")))
+    """
+    try:
+        return await awaitable
+    finally:
+        await aclose_clients()
@@ -0,0 +1,309 @@
+"""Local index of generated stories for near-duplicate detection."""
+
+import os
+import json
+import time
+import struct
+import sqlite3
+import hashlib
+import argparse
+import logging
+import threading
+from dataclasses import dataclass, asdict
+
+from storymaker.similarity import DEFAULT_MINHASH_BINS, minhash_signature, signature_similarity
+
+DEFAULT_CORPUS_PATH = ".storymaker_corpus/corpus.sqlite3"
+DEFAULT_CORPUS_THRESHOLD = 0.8
+DEFAULT_BANDS = 16
+DEFAULT_MAX_REGENERATIONS = 2
+ON_DUPLICATE_ACTIONS = ("reject", "regenerate")
+FINAL_STORY_FILE_NAME = "final.md"
+# Appended to a story's key for its draft, indexed provisionally until the story is complete.
+DRAFT_KEY_SUFFIX = "#draft"
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+class DuplicateStoryError(Exception):
+    """A story is a near-duplicate of one already in the corpus."""
+
+
+@dataclass
+class CorpusMatch:
+    key: str
+    title: str | None
+    path: str | None
+    similarity: float
+
+
+class CorpusIndex:
+    """Stories and their MinHash signatures in a single SQLite file.
+
+    Lookups use locality-sensitive hashing: every signature is cut into
+    ``bands`` bands, each stored as one indexed bucket hash, so a query only
+    compares the stories sharing a bucket with it. That keeps lookups at a
+    few index probes however many stories are indexed. With the defaults,
+    stories of similarity 0.9 are found with near certainty, and those
+    below 0.5 rarely become candidates.
+    """
+
+    def __init__(
+        self, path: str = DEFAULT_CORPUS_PATH, num_bins: int = DEFAULT_MINHASH_BINS, bands: int = DEFAULT_BANDS
+    ) -> None:
+        if num_bins % bands:
+            raise ValueError(f"num_bins ({num_bins}) must be a multiple of bands ({bands}).")
+        self.path = path
+        self.num_bins = num_bins
+        self.bands = bands
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self._lock = threading.Lock()
+        # Autocommit mode, so that add_if_unique can hold an explicit write transaction.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stories ("
+            "id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, title TEXT, path TEXT, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS signatures (story_id INTEGER NOT NULL, signature BLOB NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS signatures_story_id ON signatures (story_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bands ("
+            "bucket INTEGER NOT NULL, story_id INTEGER NOT NULL, PRIMARY KEY (bucket, story_id)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_story_id ON bands (story_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        layout = json.dumps({"num_bins": num_bins, "bands": bands})
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('layout', ?)", (layout,))
+        (stored_layout,) = self._conn.execute("SELECT value FROM meta WHERE name = 'layout'").fetchone()
+        if stored_layout != layout:
+            raise ValueError(f"Corpus {path} was built with {stored_layout}, not {layout}.")
+
+    def _buckets(self, signature: list[int]) -> list[int]:
+        rows = self.num_bins // self.bands
+        buckets = []
+        for band in range(self.bands):
+            packed = struct.pack(f">H{rows}Q", band, *signature[band * rows : (band + 1) * rows])
+            buckets.append(int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), "big", signed=True))
+        return buckets
+
+    def _pack(self, signature: list[int]) -> bytes:
+        return struct.pack(f">{self.num_bins}Q", *signature)
+
+    def _unpack(self, blob: bytes) -> list[int]:
+        return list(struct.unpack(f">{self.num_bins}Q", blob))
+
+    def _query(self, signatures: list[list[int]], threshold: float, exclude_keys: tuple[str, ...]) -> list[CorpusMatch]:
+        buckets = sorted({bucket for signature in signatures for bucket in self._buckets(signature)})
+        placeholders = ",".join("?" * len(buckets))
+        rows = self._conn.execute(f"SELECT DISTINCT story_id FROM bands WHERE bucket IN ({placeholders})", buckets)
+        candidate_ids = [row[0] for row in rows]
+        matches = {}
+        for start in range(0, len(candidate_ids), 500):
+            chunk = candidate_ids[start : start + 500]
+            rows = self._conn.execute(
+                "SELECT stories.key, stories.title, stories.path, signatures.signature "
+                "FROM signatures JOIN stories ON stories.id = signatures.story_id "
+                f"WHERE signatures.story_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, title, path, blob in rows:
+                if key in exclude_keys:
+                    continue
+                stored = self._unpack(blob)
+                similarity = max(signature_similarity(signature, stored) for signature in signatures)
+                if similarity >= threshold and (key not in matches or similarity > matches[key].similarity):
+                    matches[key] = CorpusMatch(key, title, path, similarity)
+        return sorted(matches.values(), key=lambda match: match.similarity, reverse=True)
+
+    def _remove(self, key: str) -> None:
+        row = self._conn.execute("SELECT id FROM stories WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM signatures WHERE story_id = ?", (row[0],))
+            self._conn.execute("DELETE FROM bands WHERE story_id = ?", (row[0],))
+            self._conn.execute("DELETE FROM stories WHERE id = ?", (row[0],))
+
+    def _add(self, key: str, signatures: list[list[int]], title: str | None, path: str | None) -> None:
+        self._remove(key)
+        story_id = self._conn.execute(
+            "INSERT INTO stories (key, title, path, created_at) VALUES (?, ?, ?, ?)", (key, title, path, time.time())
+        ).lastrowid
+        self._conn.executemany(
+            "INSERT INTO signatures (story_id, signature) VALUES (?, ?)",
+            [(story_id, self._pack(signature)) for signature in signatures],
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO bands (bucket, story_id) VALUES (?, ?)",
+            [(bucket, story_id) for signature in signatures for bucket in self._buckets(signature)],
+        )
+
+    def signature(self, text: str) -> list[int]:
+        return minhash_signature(text, self.num_bins)
+
+    def query(
+        self, text: str, threshold: float = DEFAULT_CORPUS_THRESHOLD, exclude_key: str | None = None
+    ) -> list[CorpusMatch]:
+        """Indexed stories at least ``threshold`` similar to ``text``, most similar first."""
+        signature = self.signature(text)
+        with self._lock:
+            return self._query([signature], threshold, (exclude_key,))
+
+    def add(
+        self,
+        key: str,
+        texts: list[str],
+        title: str | None = None,
+        path: str | None = None,
+        replaces: str | None = None,
+    ) -> None:
+        """Index ``texts`` (e.g. a story's draft and final text) under ``key``, replacing what it had.
+
+        The entry under ``replaces``, such as the story's provisional draft,
+        is removed in the same transaction.
+        """
+        signatures = [self.signature(text) for text in texts if text]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if replaces is not None:
+                    self._remove(replaces)
+                self._add(key, signatures, title, path)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add_if_unique(
+        self,
+        key: str,
+        text: str,
+        threshold: float = DEFAULT_CORPUS_THRESHOLD,
+        title: str | None = None,
+        path: str | None = None,
+        exclude_keys: tuple[str, ...] = (),
+    ) -> list[CorpusMatch]:
+        """Index ``text`` under ``key`` unless it is a near-duplicate; returns the matches found.
+
+        The entries under ``key`` and ``exclude_keys`` are not compared. The
+        lookup and the insert share one write transaction, so two processes
+        cannot both add the same story.
+        """
+        signature = self.signature(text)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                matches = self._query([signature], threshold, (key, *exclude_keys))
+                if not matches:
+                    self._add(key, [signature], title, path)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return matches
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._remove(key)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def load_corpus_index(config: dict | bool | None) -> CorpusIndex | None:
+    """Build the index described by the manuscript's ``corpus`` section.
+
+    ``true`` enables the default index; a dict may set ``path``, ``num_bins``,
+    ``bands`` and ``enabled`` (the other keys are read by ``StoryMaker``).
+    """
+    if config in (None, False):
+        return None
+    if config is True:
+        config = {}
+    if not config.get("enabled", True):
+        return None
+    return CorpusIndex(
+        path=config.get("path", DEFAULT_CORPUS_PATH),
+        num_bins=config.get("num_bins", DEFAULT_MINHASH_BINS),
+        bands=config.get("bands", DEFAULT_BANDS),
+    )
+
+
+def read_story(file_name: str) -> tuple[str | None, str]:
+    """Title and text of a story file, without the frontmatter of a novel post."""
+    with open(file_name, "r", encoding="utf-8") as f:
+        text = f.read()
+    title = None
+    if text.startswith("---\n"):
+        frontmatter, _, text = text[4:].partition("\n---\n")
+        for line in frontmatter.splitlines():
+            if line.startswith("title: "):
+                title = line[len("title: ") :]
+    return title, text
+
+
+def index_output_dirs(corpus: CorpusIndex, paths: list[str]) -> int:
+    """Index every ``final.md`` under ``paths``, keyed by its output directory; returns how many."""
+    count = 0
+    for path in paths:
+        for dir_path, _, file_names in os.walk(path):
+            if FINAL_STORY_FILE_NAME not in file_names:
+                continue
+            file_name = os.path.join(dir_path, FINAL_STORY_FILE_NAME)
+            title, text = read_story(file_name)
+            corpus.add(os.path.abspath(dir_path), [text], title, os.path.abspath(file_name))
+            count += 1
+    return count
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Index generated stories and look up near-duplicates")
+    parser.add_argument("--corpus", type=str, default=DEFAULT_CORPUS_PATH, help="Corpus database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Index the final.md of every output directory under the paths")
+    add_parser.add_argument("paths", nargs="+", help="Output directories, searched recursively")
+
+    query_parser = subparsers.add_parser("query", help="Show indexed stories similar to a text file")
+    query_parser.add_argument("file", help="Story file")
+    query_parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_CORPUS_THRESHOLD, help="Minimum estimated similarity"
+    )
+
+    subparsers.add_parser("count", help="Show the number of indexed stories")
+
+    if args is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(args)
+
+    corpus = CorpusIndex(args.corpus)
+    try:
+        if args.command == "add":
+            print(index_output_dirs(corpus, args.paths))
+        elif args.command == "query":
+            _, text = read_story(args.file)
+            for match in corpus.query(text, args.threshold):
+                print(json.dumps(asdict(match), ensure_ascii=False))
+        else:
+            print(corpus.count())
+    finally:
+        corpus.close()
+
+
+if __name__ == "__main__":
+    main()
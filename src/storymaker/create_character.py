@@ -4,8 +4,9 @@ import random
 import logging
 
 from storymaker.genre import GENRE_LIST
-from storymaker.utils import read_prompt, load_markdown_as_prompt
+from storymaker.utils import read_prompt, load_markdown_as_prompt, run_sync
 from storymaker.base_maker import BaseMaker
+from storymaker.templates import get_prompt_template
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
@@ -15,29 +16,40 @@ class CharacterMaker(BaseMaker):
     def __init__(self, manuscript_path: str, env_path: str) -> None:
         super().__init__(manuscript_path, env_path)
         self.system_prompt = read_prompt("system_prompt.md")
+        self.reset()
+
+    def reset(self) -> None:
+        super().reset()
+        self.character_settings = None
         
-    def create_character_settings(self, prompt: str, **kwargs) -> str:
+    def create_character_settings(self, prompt: str | list[str], **kwargs) -> str:
+        return run_sync(self.acreate_character_settings(prompt, **kwargs))
+
+    async def acreate_character_settings(self, prompt: str | list[str], **kwargs) -> str:
         logger.info("Creating character settings...")
         
         try:
             character_creation_kwargs = {
+                "step": "characters",
                 "model": self.manuscript["characters"]["model"],
                 "temperature": self.manuscript["characters"]["temperature"],
                 "top_p": self.manuscript["characters"]["top_p"],
             }
-            self.character_settings = self.create_chat_completion(prompt, self.system_prompt, **character_creation_kwargs)
+            self.character_settings = await self.acreate_chat_completion(prompt, self.system_prompt, **character_creation_kwargs)
             return self.character_settings
         except Exception as e:
             logger.error(f"Error creating character settings: {e}")
             raise e
 
     def make_init_prompt(self, news: str, language: str, genre: str) -> str:
+        return "".join(self.make_init_prompt_segments(news, language, genre))
+
+    def make_init_prompt_segments(self, news: str, language: str, genre: str) -> list[str]:
+        """``make_init_prompt`` split into a stable prefix and the rest, for provider prompt caching."""
         logger.info("Making initial prompt...")
         
         try:
-            prompt = read_prompt("characters.md")
-            prompt = prompt.replace("{news}", news).replace("{language}", language)
-            prompt = prompt.replace("{genre}", genre)
+            prompt = get_prompt_template("characters.md").render_segments(news=news, language=language, genre=genre)
             return prompt
         except Exception as e:
             logger.error(f"Error making initial prompt: {e}")
@@ -57,17 +69,22 @@ class CharacterMaker(BaseMaker):
             raise e
 
     def process_steps(self, news: str, output_path: str, **kwargs):
+        return run_sync(self.aprocess_steps(news, output_path, **kwargs))
+
+    async def aprocess_steps(self, news: str, output_path: str, **kwargs):
         logger.info("Processing steps...")
         
+        self.reset()
         try:
             if "language" not in kwargs:
                 kwargs["language"] = "日本語"
             if "genre" not in kwargs:
                 kwargs["genre"] = random.choice(GENRE_LIST)
             
-            prompt = self.make_init_prompt(news, kwargs["language"], kwargs["genre"])
-            self.create_character_settings(prompt, **kwargs)
+            prompt = self.make_init_prompt_segments(news, kwargs["language"], kwargs["genre"])
+            await self.acreate_character_settings(prompt, **kwargs)
             self.save_character_settings(output_path)
+            return self.character_settings
         except Exception as e:
             logger.error(f"Error processing steps: {e}")
             raise e
@@ -1,131 +1,491 @@
 import os
+import asyncio
 import datetime
 import zoneinfo
 import random
 import argparse
 import logging
 
+import openai
+
 from storymaker.utils import (
     load_markdown_as_prompt,
     count_tokens,
+    count_tokens_batch,
     read_prompt,
     no_heading_story,
+    split_story_sections,
+    story_outline,
+    run_sync,
 )
-from storymaker.classmodel import NovelFrontmatter
+from storymaker.classmodel import NovelFrontmatter, DraftScores
 from storymaker.genre import GENRE_LIST
 from storymaker.base_maker import BaseMaker
+from storymaker.checkpoint import PipelineCheckpoint
+from storymaker.pipeline import Stage, run_stages
+from storymaker.metrics import MetricsRecorder
+from storymaker.templates import get_prompt_template
+from storymaker.scoring import DEFAULT_TARGET_CHARS, score_draft, format_drafts, best_index
+from storymaker.similarity import text_change
+from storymaker.corpus import (
+    DEFAULT_CORPUS_THRESHOLD,
+    DEFAULT_MAX_REGENERATIONS,
+    ON_DUPLICATE_ACTIONS,
+    DRAFT_KEY_SUFFIX,
+    CorpusMatch,
+    DuplicateStoryError,
+    load_corpus_index,
+)
 BASE_MAX_COMPLETION_TOKENS = 100000
+# The frontmatter is a small structured object; leave room for reasoning tokens only.
+FRONTMATTER_MAX_COMPLETION_TOKENS = 16000
+DEFAULT_ENHANCEMENT_STEPS = ["enhance_story1", "enhance_story2"]
+DEFAULT_MIN_CHANGE = 0.1
+DEFAULT_MIN_LENGTH_DELTA = 0.05
+DEFAULT_MIN_PASSES = 1
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.INFO)
 
+def enhancement_token_budget(story_tokens: int, prompt_tokens: int) -> tuple[int, int]:
+    calculated_max_tokens = story_tokens * 5 + prompt_tokens
+    # Apply reasonable limits for reasoning models (need space for thinking + output)
+    # Minimum 40000 for reasoning tokens, but cap at a reasonable maximum
+    return calculated_max_tokens, min(max(calculated_max_tokens, 40000), 200000)
+
 class StoryMaker(BaseMaker):
     def __init__(self, manuscript_path: str, env_path: str) -> None:
         super().__init__(manuscript_path, env_path)
         self.system_prompt = read_prompt("system_prompt.md")
+        self.corpus = load_corpus_index(self.manuscript.get("corpus"))
+        self.reset()
+
+    def reset(self) -> None:
+        super().reset()
+        self.initial_story = None
+        self.final_story = None
+        self.no_heading_final_story = None
+        self.count_story_tokens = None
+        self.title_and_synopsis_output = None
+        self.frontmatter = None
+        self.enhancement_changes = []
+        self.corpus_key = None
+        self.corpus_draft_added = False
+        self.corpus_indexed = False
 
-    def create_story(self, first_story_idea: str, **kwargs) -> str:
+    def create_story(self, first_story_idea: str | list[str], checkpoint: PipelineCheckpoint | None = None, **kwargs) -> str:
+        return run_sync(self.acreate_story(first_story_idea, checkpoint, **kwargs))
+
+    async def acreate_story(
+        self, first_story_idea: str | list[str], checkpoint: PipelineCheckpoint | None = None, **kwargs
+    ) -> str:
         logger.info("Creating story...")
         
         try:
             if "genre" not in kwargs:
                 raise ValueError("Genre is not specified.")
             
+            enhanced_story = await self.acreate_draft(first_story_idea, checkpoint, **kwargs)
+            
+            if "count_enhancement" not in kwargs:
+                count_enhancement = 1
+            else:
+                count_enhancement = int(kwargs["count_enhancement"])
+
+            for i in range(count_enhancement):
+                enhanced_story = await self.aenhance_story(enhanced_story, i + 1, checkpoint, **kwargs)
+                
+            self.set_final_story(enhanced_story)
+            return enhanced_story
+        except Exception as e:
+            logger.error(f"Error creating story: {e}")
+            raise e
+
+    async def acreate_draft(
+        self, first_story_idea: str | list[str], checkpoint: PipelineCheckpoint | None = None, **kwargs
+    ) -> str:
+        logger.info("Creating story draft...")
+
+        try:
             draft_model = self.manuscript["story"]["model"]
             story_creation_kwargs = {
+                "step": "story",
                 "model": draft_model,
                 "temperature": self.manuscript["story"]["temperature"],
                 "top_p": self.manuscript["story"]["top_p"],
                 "reasoning_effort": self.manuscript["story"]["reasoning_effort"],
+                "stream_path": kwargs.get("stream_path"),
             }
-            story_draft = self.create_chat_completion(first_story_idea, self.system_prompt, **story_creation_kwargs)
+            candidates = int(self.manuscript["story"].get("candidates", 1))
+            story_draft = checkpoint.load("story") if checkpoint else None
+            if story_draft is None:
+                corpus_options = self.corpus_options()
+                regenerations = 0
+                if corpus_options.get("on_duplicate", "regenerate") == "regenerate":
+                    regenerations = corpus_options.get("max_regenerations", DEFAULT_MAX_REGENERATIONS)
+                for attempt in range(regenerations + 1):
+                    if attempt:
+                        story_creation_kwargs["cache_variant"] = f"regenerate{attempt}"
+                    if candidates > 1:
+                        story_draft = await self.aselect_draft(
+                            first_story_idea, candidates, kwargs.get("genre", ""), checkpoint, **story_creation_kwargs
+                        )
+                    else:
+                        story_draft = await self.acreate_chat_completion(
+                            first_story_idea, self.system_prompt, **story_creation_kwargs
+                        )
+                    matches = await self.acheck_draft(story_draft)
+                    if not matches:
+                        break
+                    logger.warning(
+                        f"Story draft is {matches[0].similarity:.0%} similar to {matches[0].title or matches[0].key}."
+                    )
+                else:
+                    raise DuplicateStoryError(
+                        f"Story draft is a near-duplicate of {matches[0].key} after {regenerations} regenerations."
+                    )
+                if checkpoint:
+                    checkpoint.save("story", story_draft)
             logger.info(f"Story draft generated.")
 
-            enhanced_story = story_draft
             self.initial_story = story_draft
-            
             self.count_story_tokens = count_tokens(story_draft, draft_model)
-            
-            if "count_enhancement" not in kwargs:
-                count_enhancement = 1
-            else:
-                count_enhancement = int(kwargs["count_enhancement"])
+            return story_draft
+        except Exception as e:
+            logger.error(f"Error creating story draft: {e}")
+            raise e
 
-            enhance_prompt_files = ["enhance_story1.md", "enhance_story2.md"]
-            enhance_models = [self.manuscript["enhance_story1"]["model"], self.manuscript["enhance_story2"]["model"]]
-            reasoning_effort = [self.manuscript["enhance_story1"]["reasoning_effort"], self.manuscript["enhance_story2"]["reasoning_effort"]]
-            for i in range(count_enhancement):
-                logger.info(f"Enhancing story {i+1}...")
-                enhance_prompt = read_prompt(enhance_prompt_files[i])
-                enhance_prompt = enhance_prompt.replace("{story}", enhanced_story)
-                enhance_prompt = enhance_prompt.replace("{genre}", kwargs["genre"])
-                
-                # Calculate token counts for debugging
-                story_tokens = self.count_story_tokens
-                prompt_tokens = count_tokens(enhance_prompt, enhance_models[i])
-                calculated_max_tokens = story_tokens * 5 + prompt_tokens
-                
-                # Apply reasonable limits for reasoning models (need space for thinking + output)
-                # Minimum 40000 for reasoning tokens, but cap at a reasonable maximum
-                max_safe_tokens = min(max(calculated_max_tokens, 40000), 200000)
-                
-                logger.info(f"Token calculation: story_tokens={story_tokens}, prompt_tokens={prompt_tokens}")
-                logger.info(f"Calculated max_tokens={calculated_max_tokens}, using safe_limit={max_safe_tokens}")
-                
-                enhancement_kwargs = {
-                    "model": enhance_models[i],
-                    "temperature": self.manuscript[f"enhance_story{i+1}"]["temperature"],
-                    "top_p": self.manuscript[f"enhance_story{i+1}"]["top_p"],
-                    "reasoning_effort": reasoning_effort[i],
-                    "max_completion_tokens": max_safe_tokens,
-                }
-                
-                enhanced_story = self.create_chat_completion(enhance_prompt, self.system_prompt, **enhancement_kwargs)
-                self.count_story_tokens = count_tokens(enhanced_story, enhance_models[i])
-                
-                logger.info(f"Story enhancement {i+1} completed.")
-                
-            self.final_story = enhanced_story
-            self.no_heading_final_story = no_heading_story(enhanced_story)
+    async def aselect_draft(
+        self,
+        first_story_idea: str | list[str],
+        candidates: int,
+        genre: str,
+        checkpoint: PipelineCheckpoint | None = None,
+        **story_creation_kwargs,
+    ) -> str:
+        """Generate ``candidates`` drafts concurrently and return the best scoring one.
+
+        Drafts are scored by the ``story_scoring`` manuscript step when it is
+        configured, and by the local ``score_draft`` heuristic otherwise or
+        when the scoring call fails. Failed candidates are left out (their
+        score is recorded as None); only when all of them fail is the error
+        raised.
+        """
+        logger.info(f"Creating {candidates} candidate drafts...")
+
+        try:
+            candidate_kwargs = dict(story_creation_kwargs, stream_path=None)
+            variant = candidate_kwargs.pop("cache_variant", None)
+            variants = [variant] + [
+                f"{variant}/candidate{i}" if variant else f"candidate{i}" for i in range(1, candidates)
+            ]
+            results = await asyncio.gather(
+                *(
+                    self.acreate_chat_completion(
+                        first_story_idea, self.system_prompt, cache_variant=variants[i], **candidate_kwargs
+                    )
+                    for i in range(candidates)
+                ),
+                return_exceptions=True,
+            )
+            failures = [(i, result) for i, result in enumerate(results) if isinstance(result, BaseException)]
+            for i, error in failures:
+                if not isinstance(error, Exception):
+                    raise error
+                logger.warning(f"Candidate draft {i + 1} failed: {error}")
+            if len(failures) == candidates:
+                raise failures[-1][1]
+            # Candidate index of every surviving draft, to keep scores aligned with the candidates.
+            survivors = [i for i, result in enumerate(results) if not isinstance(result, BaseException)]
+            drafts = [results[i] for i in survivors]
+            scores = None
+            if "story_scoring" in self.manuscript:
+                try:
+                    scores = await self.ascore_drafts(drafts, genre)
+                except Exception as e:
+                    logger.warning(f"Scoring drafts with a model failed, using the heuristic instead: {e}")
+            if scores is None:
+                target_chars = self.manuscript["story"].get("target_chars", DEFAULT_TARGET_CHARS)
+                scores = [score_draft(draft, target_chars) for draft in drafts]
+
+            candidate_scores = [None] * candidates
+            for i, score in zip(survivors, scores):
+                candidate_scores[i] = score
+            winner = survivors[best_index(scores)]
+            logger.info(f"Draft scores: {candidate_scores}, continuing with candidate {winner + 1}.")
+            if checkpoint:
+                checkpoint.set("draft_scores", candidate_scores)
+            return results[winner]
+        except Exception as e:
+            logger.error(f"Error selecting story draft: {e}")
+            raise e
+
+    def corpus_options(self) -> dict:
+        """The manuscript's ``corpus`` section as a dict, empty when the corpus index is off."""
+        if self.corpus is None:
+            return {}
+        options = self.manuscript.get("corpus")
+        return options if isinstance(options, dict) else {}
+
+    async def acheck_draft(self, story_draft: str) -> list[CorpusMatch]:
+        """Near-duplicates of ``story_draft`` in the corpus index, most similar first.
+
+        A unique draft is indexed right away, so that concurrently running
+        pipelines see each other's drafts. It goes under its own draft key,
+        which ``add_to_corpus`` replaces with ``corpus_key`` and
+        ``aprocess_steps`` removes again when no story comes of it; a story
+        already indexed under ``corpus_key`` stays until then.
+        """
+        if self.corpus is None:
+            return []
+        options = self.corpus_options()
+        if options.get("on_duplicate", "regenerate") not in ON_DUPLICATE_ACTIONS:
+            raise ValueError(f"corpus.on_duplicate must be one of {ON_DUPLICATE_ACTIONS}.")
+        threshold = options.get("threshold", DEFAULT_CORPUS_THRESHOLD)
+        if self.corpus_key is None:
+            return await asyncio.to_thread(self.corpus.query, story_draft, threshold)
+        matches = await asyncio.to_thread(
+            self.corpus.add_if_unique,
+            self.corpus_key + DRAFT_KEY_SUFFIX,
+            story_draft,
+            threshold,
+            exclude_keys=(self.corpus_key,),
+        )
+        if not matches:
+            self.corpus_draft_added = True
+        return matches
+
+    def add_to_corpus(self, file_name: str) -> None:
+        """Index the draft and the final story under ``corpus_key``, replacing the draft indexed before."""
+        logger.info("Adding story to the corpus index...")
+
+        try:
+            self.corpus.add(
+                self.corpus_key,
+                [self.initial_story, self.no_heading_final_story],
+                self.frontmatter.title if self.frontmatter else None,
+                os.path.abspath(file_name),
+                replaces=self.corpus_key + DRAFT_KEY_SUFFIX,
+            )
+            self.corpus_indexed = True
+        except Exception as e:
+            logger.error(f"Error adding story to the corpus index: {e}")
+            raise e
+
+    async def ascore_drafts(self, drafts: list[str], genre: str) -> list[float]:
+        """Score ``drafts`` with one structured call of the ``story_scoring`` step."""
+        scoring_kwargs = {
+            "step": "story_scoring",
+            "model": self.manuscript["story_scoring"]["model"],
+            "temperature": self.manuscript["story_scoring"].get("temperature", 0),
+            "top_p": self.manuscript["story_scoring"].get("top_p", 0),
+            "response_format": DraftScores,
+        }
+        scoring_prompt = get_prompt_template("score_drafts.md").render_segments(
+            genre=genre, drafts=format_drafts(drafts)
+        )
+        response = await self.acreate_chat_completion(scoring_prompt, self.system_prompt, **scoring_kwargs)
+        scores = [0.0] * len(drafts)
+        for draft_score in response.scores:
+            if 1 <= draft_score.candidate <= len(drafts):
+                scores[draft_score.candidate - 1] = float(draft_score.score)
+        return scores
+
+    async def aenhance_story(
+        self, story: str, index: int, checkpoint: PipelineCheckpoint | None = None, step: str | None = None, **kwargs
+    ) -> str:
+        """Run enhancement pass ``index`` (1-based) over ``story``.
+
+        ``step`` names the manuscript section of the pass (``enhance_story<index>``
+        by default); its ``prompt`` option picks the prompt file, ``<step>.md``
+        by default.
+        """
+        logger.info(f"Enhancing story {index}...")
+
+        try:
+            step = step or f"enhance_story{index}"
+            enhance_model = self.manuscript[step]["model"]
+            checkpointed_story = checkpoint.load(step) if checkpoint else None
+            if checkpointed_story is not None:
+                self.count_story_tokens = count_tokens(checkpointed_story, enhance_model)
+                return checkpointed_story
+
+            sections = split_story_sections(story) if self.manuscript[step].get("section_parallel", False) else []
+            if len(sections) > 1:
+                enhanced_story = await self.aenhance_sections(sections, step, **kwargs)
+                if checkpoint:
+                    checkpoint.save(step, enhanced_story)
+                self.count_story_tokens = count_tokens(enhanced_story, enhance_model)
+                logger.info(f"Story enhancement {index} completed over {len(sections)} sections.")
+                return enhanced_story
+
+            enhance_prompt = get_prompt_template(self.manuscript[step].get("prompt", f"{step}.md")).render_segments(
+                allow_extra=True, story=story, genre=kwargs["genre"]
+            )
+            
+            # Calculate token counts for debugging
+            story_tokens, prompt_tokens = count_tokens_batch([story, "".join(enhance_prompt)], enhance_model)
+            calculated_max_tokens, max_safe_tokens = enhancement_token_budget(story_tokens, prompt_tokens)
+            
+            logger.info(f"Token calculation: story_tokens={story_tokens}, prompt_tokens={prompt_tokens}")
+            logger.info(f"Calculated max_tokens={calculated_max_tokens}, using safe_limit={max_safe_tokens}")
+            
+            enhancement_kwargs = {
+                "step": step,
+                "model": enhance_model,
+                "temperature": self.manuscript[step]["temperature"],
+                "top_p": self.manuscript[step]["top_p"],
+                "reasoning_effort": self.manuscript[step]["reasoning_effort"],
+                "max_completion_tokens": max_safe_tokens,
+                "stream_path": kwargs.get("stream_path"),
+            }
+            
+            enhanced_story = await self.acreate_chat_completion(enhance_prompt, self.system_prompt, **enhancement_kwargs)
+            if checkpoint:
+                checkpoint.save(step, enhanced_story)
+            self.count_story_tokens = count_tokens(enhanced_story, enhance_model)
+            
+            logger.info(f"Story enhancement {index} completed.")
             return enhanced_story
         except Exception as e:
-            logger.error(f"Error creating story: {e}")
+            logger.error(f"Error enhancing story: {e}")
             raise e
 
-    def create_title_and_synopsis(self) -> str:
+    async def aenhance_pass(
+        self, story: str, index: int, step: str, checkpoint: PipelineCheckpoint | None = None, **kwargs
+    ) -> str:
+        """Enhancement pass ``index`` with ``step``, skipped once the story has converged.
+
+        With ``"adaptive": true`` in the manuscript's ``enhancement`` section,
+        every pass measures how much it changed the story (see
+        ``similarity.text_change``). Once a pass past ``min_passes`` changed
+        less than ``min_change`` and the length by less than
+        ``min_length_delta``, the remaining passes return the story as is.
+        """
+        if self.enhancement_changes and self.enhancement_changes[-1]["converged"]:
+            logger.info(f"Skipping {step}, the story has converged.")
+            return story
+        enhanced_story = await self.aenhance_story(story, index, checkpoint, step=step, **kwargs)
+
+        options = self.manuscript.get("enhancement", {})
+        if options.get("adaptive", False):
+            diff_ratio, length_delta = text_change(story, enhanced_story)
+            converged = (
+                index >= options.get("min_passes", DEFAULT_MIN_PASSES)
+                and diff_ratio < options.get("min_change", DEFAULT_MIN_CHANGE)
+                and length_delta < options.get("min_length_delta", DEFAULT_MIN_LENGTH_DELTA)
+            )
+            logger.info(
+                f"Enhancement {step} changed {diff_ratio:.1%} of the story and its length by {length_delta:.1%}"
+                + (", the story has converged." if converged else ".")
+            )
+            self.enhancement_changes.append(
+                {"step": step, "diff_ratio": diff_ratio, "length_delta": length_delta, "converged": converged}
+            )
+            if checkpoint:
+                checkpoint.set("enhancement_changes", self.enhancement_changes)
+        return enhanced_story
+
+    async def aenhance_sections(self, sections: list[str], step: str, **kwargs) -> str:
+        """Enhance ``sections`` concurrently with the ``enhance_section.md`` prompt and join them.
+
+        Every request shares an outline of the whole story, placed before the
+        section itself so it can be served from the provider's prompt cache.
+        """
+        enhance_model = self.manuscript[step]["model"]
+        template = get_prompt_template("enhance_section.md")
+        outline = story_outline(sections)
+        semaphore = asyncio.Semaphore(self.manuscript[step].get("section_concurrency", len(sections)))
+
+        async def enhance(number: int, section: str) -> str:
+            section_prompt = template.render_segments(
+                allow_extra=True,
+                stable=("outline",),
+                outline=outline,
+                section=section,
+                section_number=str(number),
+                section_count=str(len(sections)),
+                genre=kwargs["genre"],
+            )
+            section_tokens, prompt_tokens = count_tokens_batch([section, "".join(section_prompt)], enhance_model)
+            _, max_safe_tokens = enhancement_token_budget(section_tokens, prompt_tokens)
+            section_kwargs = {
+                "step": step,
+                "model": enhance_model,
+                "temperature": self.manuscript[step]["temperature"],
+                "top_p": self.manuscript[step]["top_p"],
+                "reasoning_effort": self.manuscript[step]["reasoning_effort"],
+                "max_completion_tokens": max_safe_tokens,
+            }
+            async with semaphore:
+                enhanced_section = await self.acreate_chat_completion(section_prompt, self.system_prompt, **section_kwargs)
+            enhanced_section = enhanced_section.strip()
+            heading = section.partition("\n")[0]
+            if heading.startswith("#") and not enhanced_section.startswith("#"):
+                enhanced_section = f"{heading}\n\n{enhanced_section}"
+            return enhanced_section
+
+        logger.info(f"Enhancing {len(sections)} sections concurrently...")
+        enhanced_sections = await asyncio.gather(*(enhance(i, section) for i, section in enumerate(sections, start=1)))
+        return "\n\n".join(enhanced_sections) + "\n"
+
+    def set_final_story(self, story: str) -> None:
+        self.final_story = story
+        self.no_heading_final_story = no_heading_story(story)
+
+    def create_title_and_synopsis(self, checkpoint: PipelineCheckpoint | None = None) -> str:
+        return run_sync(self.acreate_title_and_synopsis(checkpoint))
+
+    async def acreate_title_and_synopsis(self, checkpoint: PipelineCheckpoint | None = None) -> str:
         logger.info("Creating title and synopsis...")
         try:
+            checkpointed_output = checkpoint.load("title_and_synopsis") if checkpoint else None
+            if checkpointed_output is not None:
+                self.title_and_synopsis_output = checkpointed_output
+                return self.title_and_synopsis_output
+
             title_and_synopsis_model = self.manuscript["title_and_synopsis"]["model"]
             title_and_synopsis_kwargs = {
+                "step": "title_and_synopsis",
                 "model": title_and_synopsis_model,
                 "temperature": self.manuscript["title_and_synopsis"]["temperature"],
                 "top_p": self.manuscript["title_and_synopsis"]["top_p"],
                 "reasoning_effort": self.manuscript["title_and_synopsis"].get("reasoning_effort", "medium"),
             }
-            title_and_synopsis_prompt = read_prompt("title_synopsis.md")
-            title_and_synopsis_prompt = title_and_synopsis_prompt.replace("{story}", self.final_story)
-            self.title_and_synopsis_output = self.create_chat_completion(
+            title_and_synopsis_prompt = get_prompt_template("title_synopsis.md").render_segments(story=self.final_story)
+            self.title_and_synopsis_output = await self.acreate_chat_completion(
                 title_and_synopsis_prompt, self.system_prompt, **title_and_synopsis_kwargs
             )
+            if checkpoint:
+                checkpoint.save("title_and_synopsis", self.title_and_synopsis_output)
             return self.title_and_synopsis_output
         except Exception as e:
             logger.error(f"Error creating title and synopsis: {e}")
             raise e
 
-    def create_frontmatter(self) -> str:
+    def create_frontmatter(self, checkpoint: PipelineCheckpoint | None = None) -> str:
+        return run_sync(self.acreate_frontmatter(checkpoint))
+
+    async def acreate_frontmatter(self, checkpoint: PipelineCheckpoint | None = None) -> str:
         logger.info("Creating frontmatter...")
         try:
+            checkpointed_frontmatter = checkpoint.load("frontmatter") if checkpoint else None
+            if checkpointed_frontmatter is not None:
+                self.frontmatter = NovelFrontmatter.model_validate_json(checkpointed_frontmatter)
+                return self.frontmatter
+
             frontmatter_model = self.manuscript["frontmatter"]["model"]
             frontmatter_kwargs = {
+                "step": "frontmatter",
                 "model": frontmatter_model,
                 "temperature": self.manuscript["frontmatter"]["temperature"],
                 "top_p": self.manuscript["frontmatter"]["top_p"],
+                "max_completion_tokens": FRONTMATTER_MAX_COMPLETION_TOKENS,
                 "response_format": NovelFrontmatter,
             }
-            frontmatter_prompt = read_prompt("frontmatter.md")
-            frontmatter_prompt = frontmatter_prompt.replace(
-                "{title_and_synopsis}", self.title_and_synopsis_output
+            frontmatter_prompt = get_prompt_template("frontmatter.md").render_segments(
+                title_and_synopsis=self.title_and_synopsis_output
             )
             # client = openai.OpenAI(api_key=load_api_key(self.env_path, "OPENAI_API_KEY"))
             # response = client.beta.chat.completions.parse(
@@ -133,18 +493,68 @@ class StoryMaker(BaseMaker):
             #     messages=[{"role": "user", "content": frontmatter_prompt}],
             #     response_format=NovelFrontmatter,
             # )
-            response = self.create_chat_completion(frontmatter_prompt, self.system_prompt, **frontmatter_kwargs)
+            response = await self.acreate_chat_completion(frontmatter_prompt, self.system_prompt, **frontmatter_kwargs)
             self.frontmatter = response
+            if checkpoint:
+                checkpoint.save("frontmatter", self.frontmatter.model_dump_json())
             # self.frontmatter = self.create_chat_completion(
             #     frontmatter_prompt, model=frontmatter_model, 
             #     response_format=NovelFrontmatter
             # )
-            print(self.frontmatter)
+            logger.debug(f"frontmatter: {self.frontmatter}")
             return self.frontmatter
         except Exception as e:
             logger.error(f"Error creating frontmatter: {e}")
             raise e
 
+    def create_fused_frontmatter(self, checkpoint: PipelineCheckpoint | None = None) -> NovelFrontmatter:
+        return run_sync(self.acreate_fused_frontmatter(checkpoint))
+
+    async def acreate_fused_frontmatter(self, checkpoint: PipelineCheckpoint | None = None) -> NovelFrontmatter:
+        """Title, synopsis and frontmatter in one structured call on the final story.
+
+        Used when the manuscript's ``title_and_synopsis`` step has ``"fused": true``;
+        the call uses that step's model and options. If the response cannot be
+        parsed into a complete ``NovelFrontmatter``, the two-step path
+        (``acreate_title_and_synopsis`` then ``acreate_frontmatter``) runs instead.
+        """
+        logger.info("Creating fused title, synopsis and frontmatter...")
+        try:
+            checkpointed_frontmatter = checkpoint.load("frontmatter") if checkpoint else None
+            if checkpointed_frontmatter is not None:
+                self.frontmatter = NovelFrontmatter.model_validate_json(checkpointed_frontmatter)
+                return self.frontmatter
+
+            fused_kwargs = {
+                "step": "title_and_synopsis",
+                "model": self.manuscript["title_and_synopsis"]["model"],
+                "temperature": self.manuscript["title_and_synopsis"]["temperature"],
+                "top_p": self.manuscript["title_and_synopsis"]["top_p"],
+                "reasoning_effort": self.manuscript["title_and_synopsis"].get("reasoning_effort", "medium"),
+                "max_completion_tokens": FRONTMATTER_MAX_COMPLETION_TOKENS,
+                "response_format": NovelFrontmatter,
+            }
+            fused_prompt = get_prompt_template("fused_frontmatter.md").render_segments(story=self.final_story)
+            try:
+                frontmatter = await self.acreate_chat_completion(fused_prompt, self.system_prompt, **fused_kwargs)
+                if frontmatter is None or not frontmatter.title.strip() or not frontmatter.synopsis.strip():
+                    raise ValueError(f"Incomplete frontmatter: {frontmatter}")
+            except (ValueError, openai.LengthFinishReasonError, openai.ContentFilterFinishReasonError) as e:
+                logger.warning(f"Fused frontmatter could not be parsed, falling back to two steps: {e}")
+                await self.acreate_title_and_synopsis(checkpoint)
+                return await self.acreate_frontmatter(checkpoint)
+
+            self.frontmatter = frontmatter
+            self.title_and_synopsis_output = f"# {frontmatter.title}\n\n{frontmatter.synopsis}\n"
+            if checkpoint:
+                checkpoint.save("title_and_synopsis", self.title_and_synopsis_output)
+                checkpoint.save("frontmatter", self.frontmatter.model_dump_json())
+            logger.debug(f"frontmatter: {self.frontmatter}")
+            return self.frontmatter
+        except Exception as e:
+            logger.error(f"Error creating fused frontmatter: {e}")
+            raise e
+
     def save_story_as_plain_text(self, story: str, file_name: str):
         logger.info(f"Saving story as plain text to {file_name}...")
         
@@ -184,27 +594,90 @@ class StoryMaker(BaseMaker):
             logger.error(f"Error creating novel post: {e}")
             raise e
 
-    def process_steps(self, characters: str, output_dir: str, **kwargs):
+    def process_steps(self, characters: str, output_dir: str, resume: bool = False, **kwargs):
+        return run_sync(self.aprocess_steps(characters, output_dir, resume, **kwargs))
+
+    async def aprocess_steps(self, characters: str, output_dir: str, resume: bool = False, **kwargs):
         logger.info("Processing steps...")
         
+        self.reset()
+        self.corpus_key = os.path.abspath(output_dir)
+        recorder = MetricsRecorder()
+        self.hooks.append(recorder)
         try:
-            init_prompt = read_prompt("initial_story.md")
-            init_prompt = init_prompt.replace("{characters}", characters)
+            checkpoint = PipelineCheckpoint(output_dir, resume=resume)
             if "genre" not in kwargs:
-                genre = random.choice(GENRE_LIST)
+                genre = checkpoint.get("genre") or random.choice(GENRE_LIST)
                 kwargs["genre"] = genre
-            init_prompt = init_prompt.replace("{genre}", kwargs["genre"])
+            checkpoint.set("genre", kwargs["genre"])
+            init_prompt = get_prompt_template("initial_story.md").render_segments(
+                characters=characters, genre=kwargs["genre"]
+            )
 
-            self.create_story(init_prompt, count_enhancement=2, **kwargs)
             plain_text_file_name = os.path.join(output_dir, "story.md")
-            self.save_story_as_plain_text(self.no_heading_final_story, plain_text_file_name)
-            self.create_title_and_synopsis()
-            self.create_frontmatter()
             final_file_name = os.path.join(output_dir, "final.md")
-            self.create_novel_post(final_file_name)
+            enhancement_steps = self.manuscript.get("enhancement", {}).get("steps", DEFAULT_ENHANCEMENT_STEPS)
+            kwargs["stream_path"] = plain_text_file_name
+
+            stages = [Stage("story", lambda results: self.acreate_draft(init_prompt, checkpoint, **kwargs))]
+            previous = "story"
+            for i, step in enumerate(enhancement_steps, start=1):
+                stages.append(
+                    Stage(
+                        step,
+                        lambda results, i=i, step=step, previous=previous: self.aenhance_pass(
+                            results[previous], i, step, checkpoint, **kwargs
+                        ),
+                        (previous,),
+                    )
+                )
+                previous = step
+
+            async def finalize_story(results: dict, previous=previous) -> str:
+                self.set_final_story(results[previous])
+                return self.final_story
+
+            stages += [
+                Stage("final_story", finalize_story, (previous,)),
+                Stage(
+                    "save_story",
+                    lambda results: self.save_story_as_plain_text(self.no_heading_final_story, plain_text_file_name),
+                    ("final_story",),
+                    blocking=True,
+                ),
+            ]
+            if self.manuscript["title_and_synopsis"].get("fused", False):
+                stages.append(
+                    Stage("frontmatter", lambda results: self.acreate_fused_frontmatter(checkpoint), ("final_story",))
+                )
+            else:
+                stages += [
+                    Stage(
+                        "title_and_synopsis",
+                        lambda results: self.acreate_title_and_synopsis(checkpoint),
+                        ("final_story",),
+                    ),
+                    Stage("frontmatter", lambda results: self.acreate_frontmatter(checkpoint), ("title_and_synopsis",)),
+                ]
+            stages.append(
+                Stage(
+                    "novel_post", lambda results: self.create_novel_post(final_file_name), ("frontmatter",), blocking=True
+                )
+            )
+            if self.corpus is not None:
+                stages.append(
+                    Stage("corpus", lambda results: self.add_to_corpus(final_file_name), ("novel_post",), blocking=True)
+                )
+            await run_stages(stages)
         except Exception as e:
             logger.error(f"Error processing steps: {e}")
             raise e
+        finally:
+            self.hooks.remove(recorder)
+            recorder.write_report(output_dir)
+            if self.corpus_draft_added and not self.corpus_indexed:
+                # This run indexed its draft when it passed the duplicate check, but produced no story.
+                await asyncio.to_thread(self.corpus.remove, self.corpus_key + DRAFT_KEY_SUFFIX)
 
 def main(args=None):
     parser = argparse.ArgumentParser(description="Create a story")
@@ -223,6 +696,9 @@ def main(args=None):
     parser.add_argument(
         "--genre", "-g", type=str, required=False, help=("Genre of the story.")
     )
+    parser.add_argument(
+        "--resume", action="store_true", help=("Resume from the last completed stage in the output directory.")
+    )
     kwargs = {}
 
     if args is None:
@@ -235,7 +711,7 @@ def main(args=None):
 
     story_maker = StoryMaker(args.manuscript, args.env)
     characters = load_markdown_as_prompt(args.input)
-    story_maker.process_steps(characters, args.output_dir, **kwargs)
+    story_maker.process_steps(characters, args.output_dir, resume=args.resume, **kwargs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,347 @@
+"""Deferred chat completions through the provider's Batch API."""
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+import weakref
+
+import openai
+import pydantic
+from openai.types.chat import ChatCompletion, ParsedChatCompletion
+
+from storymaker.scheduler import RETRYABLE_STATUS_CODES, RequestScheduler
+
+DEFAULT_STATE_PATH = ".storymaker_batches/requests.sqlite3"
+DEFAULT_COLLECT_SECONDS = 5.0
+DEFAULT_POLL_INTERVAL = 30.0
+DEFAULT_MAX_BATCH_SIZE = 50000
+DEFAULT_COMPLETION_WINDOW = "24h"
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+# event loop -> {(client id, options): batcher}
+_batchers = weakref.WeakKeyDictionary()
+_batchers_lock = threading.Lock()
+
+
+class DeferredRequestError(Exception):
+    """A request of a batch failed or got no result."""
+
+
+class BatchState:
+    """Which batch every submitted request went into, kept in a SQLite file.
+
+    A request stays recorded until its result has been handed out, so a run
+    restarted while a batch is in progress waits for that batch instead of
+    submitting the request again.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH) -> None:
+        self.path = path
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS requests ("
+            "custom_id TEXT PRIMARY KEY, batch_id TEXT NOT NULL, submitted_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def batch_of(self, custom_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT batch_id FROM requests WHERE custom_id = ?", (custom_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def add(self, batch_id: str, custom_ids: list[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO requests (custom_id, batch_id, submitted_at) VALUES (?, ?, ?)",
+                [(custom_id, batch_id, now) for custom_id in custom_ids],
+            )
+            self._conn.commit()
+
+    def remove(self, custom_ids: list[str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM requests WHERE custom_id = ?", [(custom_id,) for custom_id in custom_ids]
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def strict_json_schema(schema):
+    """Copy of a pydantic JSON schema in the form strict structured outputs require.
+
+    Every object is closed and requires all of its properties.
+    """
+    if isinstance(schema, list):
+        return [strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    strict = {key: strict_json_schema(value) for key, value in schema.items()}
+    if strict.get("type") == "object" and "properties" in strict:
+        strict["additionalProperties"] = False
+        strict["required"] = list(strict["properties"])
+    if "default" in strict and strict["default"] is None:
+        del strict["default"]
+    return strict
+
+
+def response_format_param(response_format: type[pydantic.BaseModel]) -> dict:
+    """``response_format`` request parameter asking for JSON matching the pydantic model."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "schema": strict_json_schema(response_format.model_json_schema()),
+            "name": response_format.__name__,
+            "strict": True,
+        },
+    }
+
+
+def parse_completion(body: dict, response_format: type[pydantic.BaseModel]) -> ParsedChatCompletion:
+    """Chat completion response ``body`` with the content of every message parsed into ``response_format``.
+
+    Raises the same errors as the SDK's ``parse`` on a length or content
+    filter cutoff; a refused or empty message gets ``parsed=None``.
+    """
+    completion = ChatCompletion.model_validate(body)
+    body = completion.model_dump()
+    for choice in body["choices"]:
+        if choice["finish_reason"] == "length":
+            raise openai.LengthFinishReasonError(completion=completion)
+        if choice["finish_reason"] == "content_filter":
+            raise openai.ContentFilterFinishReasonError()
+        message = choice["message"]
+        content = message.get("content")
+        message["parsed"] = None
+        if content and not message.get("refusal"):
+            message["parsed"] = response_format.model_validate_json(content)
+    return ParsedChatCompletion[response_format].model_validate(body)
+
+
+def request_body(params: dict) -> dict:
+    """JSON body of a chat completion request, as written to a batch input file."""
+    body = {key: value for key, value in params.items() if value is not None}
+    if isinstance(body.get("response_format"), type):
+        body["response_format"] = response_format_param(body["response_format"])
+    return body
+
+
+def parse_jsonl(text: str) -> dict:
+    """Lines of a batch output or error file, by ``custom_id``."""
+    lines = {}
+    for line in text.splitlines():
+        if line.strip() == "":
+            continue
+        entry = json.loads(line)
+        lines[entry["custom_id"]] = entry
+    return lines
+
+
+class DeferredBatcher:
+    """Collects chat completion requests and sends them as provider batches.
+
+    Requests arriving within ``collect_seconds`` of the first pending one go
+    into the same batch (up to ``max_batch_size``); identical requests are
+    sent once. The batch is polled every ``poll_interval`` seconds and every
+    waiting caller gets its own result, so pipelines that awaited a deferred
+    stage simply resume at their next stage. Requests failing with a
+    transient status go into the next batch, up to the scheduler's
+    ``max_retries`` times.
+    """
+
+    def __init__(self, client: openai.AsyncOpenAI, scheduler: RequestScheduler, options: dict | None = None) -> None:
+        options = options or {}
+        self.client = client
+        self.scheduler = scheduler
+        self.collect_seconds = options.get("collect_seconds", DEFAULT_COLLECT_SECONDS)
+        self.poll_interval = options.get("poll_interval", DEFAULT_POLL_INTERVAL)
+        self.max_batch_size = options.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE)
+        self.completion_window = options.get("completion_window", DEFAULT_COMPLETION_WINDOW)
+        self.state = BatchState(options.get("state_path", DEFAULT_STATE_PATH))
+        self._pending = {}  # custom_id -> request body
+        self._futures = {}  # custom_id -> future of the response body
+        self._bodies = {}  # custom_id -> request body of the waiting requests
+        self._batch_of = {}  # custom_id -> batch_id of the waiting requests
+        self._retries = {}  # custom_id -> times the request was sent again after a transient error
+        self._unclaimed = {}  # custom_id -> result line nobody waited for yet
+        self._polls = {}  # batch_id -> poll task
+        self._flush_task = None
+
+    async def complete(self, params: dict, custom_id: str) -> dict:
+        """Response body of the chat completion request ``params``, once its batch is done."""
+        future = self._futures.get(custom_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[custom_id] = future
+            self._bodies[custom_id] = request_body(params)
+            batch_id = self.state.batch_of(custom_id)
+            if custom_id in self._unclaimed:
+                self._resolve([custom_id], {custom_id: self._unclaimed.pop(custom_id)}, None)
+            elif batch_id is not None:
+                logger.info(f"Request {custom_id[:12]} was already submitted in batch {batch_id}.")
+                self._batch_of[custom_id] = batch_id
+                self._poll(batch_id)
+            else:
+                self._queue(custom_id)
+        # Shielded, so that one cancelled caller does not cancel the result for the others.
+        return await asyncio.shield(future)
+
+    def _queue(self, custom_id: str) -> None:
+        self._pending[custom_id] = self._bodies[custom_id]
+        if len(self._pending) >= self.max_batch_size:
+            asyncio.create_task(self._flush())
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush(self.collect_seconds))
+
+    async def _flush(self, delay: float = 0.0) -> None:
+        if delay > 0:
+            await asyncio.sleep(delay)
+            self._flush_task = None
+        requests, self._pending = self._pending, {}
+        if requests:
+            await self._submit(requests)
+
+    async def _submit(self, requests: dict) -> None:
+        lines = [
+            json.dumps(
+                {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}, ensure_ascii=False
+            )
+            for custom_id, body in requests.items()
+        ]
+        try:
+            input_file = await self.scheduler.run(
+                "batch",
+                0,
+                lambda: self.client.files.create(
+                    file=("requests.jsonl", ("\n".join(lines) + "\n").encode("utf-8")), purpose="batch"
+                ),
+            )
+            batch = await self.scheduler.run(
+                "batch",
+                0,
+                lambda: self.client.batches.create(
+                    input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=self.completion_window
+                ),
+            )
+        except Exception as e:
+            logger.error(f"Error submitting batch of {len(requests)} requests: {e}")
+            self._resolve(list(requests), {}, e)
+            return
+        self.state.add(batch.id, list(requests))
+        for custom_id in requests:
+            self._batch_of[custom_id] = batch.id
+        logger.info(f"Submitted batch {batch.id} with {len(requests)} requests.")
+        self._poll(batch.id)
+
+    def _poll(self, batch_id: str) -> None:
+        if batch_id not in self._polls:
+            self._polls[batch_id] = asyncio.create_task(self._poll_batch(batch_id))
+
+    async def _poll_batch(self, batch_id: str) -> None:
+        try:
+            while True:
+                batch = await self.scheduler.run("batch", 0, lambda: self.client.batches.retrieve(batch_id))
+                if batch.status in FINAL_BATCH_STATUSES:
+                    break
+                logger.debug(f"Batch {batch_id} is {batch.status}.")
+                await asyncio.sleep(self.poll_interval)
+            logger.info(f"Batch {batch_id} is {batch.status}.")
+            results = {}
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    content = await self.scheduler.run("batch", 0, lambda: self.client.files.content(file_id))
+                    results.update(parse_jsonl(content.text))
+        except openai.NotFoundError:
+            results = None
+            error = None
+        except Exception as e:
+            logger.error(f"Error polling batch {batch_id}: {e}")
+            results = None
+            error = e
+        else:
+            error = DeferredRequestError(f"Batch {batch_id} is {batch.status} without a result for the request.")
+        finally:
+            del self._polls[batch_id]
+        waiting = {custom_id for custom_id, waiting_batch_id in self._batch_of.items() if waiting_batch_id == batch_id}
+        if results is None and error is None:
+            # The batch, or its output file, is gone at the provider: send the requests again.
+            logger.warning(f"Batch {batch_id} was not found, submitting its {len(waiting)} waiting requests again.")
+            self.state.remove(list(waiting))
+            for custom_id in waiting:
+                del self._batch_of[custom_id]
+                self._queue(custom_id)
+            return
+        if results is None:
+            # The batch stays recorded, so that a later run can poll it again.
+            self._resolve(list(waiting), {}, error)
+            return
+        for custom_id in list(waiting):
+            response = (results.get(custom_id) or {}).get("response") or {}
+            status_code = response.get("status_code", 200)
+            retryable = status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+            if retryable and self._retries.get(custom_id, 0) < self.scheduler.max_retries:
+                self._retries[custom_id] = self._retries.get(custom_id, 0) + 1
+                logger.info(f"Request {custom_id[:12]} failed with status {status_code}, sending it again.")
+                waiting.discard(custom_id)
+                del self._batch_of[custom_id]
+                self._queue(custom_id)
+        self._resolve(list(waiting), results, error)
+        # Results of a batch submitted by an earlier run may be asked for later in this one.
+        for custom_id, entry in results.items():
+            if custom_id not in waiting:
+                self._unclaimed[custom_id] = entry
+        self.state.remove(list(results.keys() | waiting))
+
+    def _resolve(self, custom_ids: list[str], results: dict, error: Exception | None) -> None:
+        for custom_id in custom_ids:
+            future = self._futures.pop(custom_id)
+            self._bodies.pop(custom_id, None)
+            self._retries.pop(custom_id, None)
+            self._batch_of.pop(custom_id, None)
+            entry = results.get(custom_id)
+            response = entry.get("response") if entry is not None else None
+            if response is not None and response.get("status_code") == 200:
+                future.set_result(response["body"])
+            elif entry is not None:
+                message = (response or {}).get("body") or entry.get("error")
+                future.set_exception(DeferredRequestError(f"Request {custom_id[:12]} failed: {message}"))
+            else:
+                future.set_exception(error)
+
+
+def get_deferred_batcher(
+    client: openai.AsyncOpenAI, scheduler: RequestScheduler, options: dict | None = None
+) -> DeferredBatcher:
+    """Return the batcher shared by all makers using ``client`` in the running event loop.
+
+    Sharing it is what puts the requests of many concurrently running
+    pipelines into one batch. ``options`` is the manuscript's ``deferred``
+    section: ``collect_seconds``, ``poll_interval``, ``max_batch_size``,
+    ``completion_window`` and ``state_path``.
+    """
+    options = options or {}
+    loop = asyncio.get_running_loop()
+    key = (id(client), json.dumps(options, sort_keys=True))
+    with _batchers_lock:
+        batchers = _batchers.setdefault(loop, {})
+        batcher = batchers.get(key)
+        if batcher is None:
+            batcher = DeferredBatcher(client, scheduler, options)
+            batchers[key] = batcher
+        return batcher
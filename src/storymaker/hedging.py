@@ -0,0 +1,135 @@
+"""Hedged requests over a model fallback chain, timed by per-model latency histograms."""
+
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections.abc import Awaitable, Callable
+
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+HISTOGRAM_MIN_SECONDS = 0.01
+HISTOGRAM_GROWTH = 1.05
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+# (model, step) -> LatencyHistogram, shared by all makers in the process
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+class LatencyHistogram:
+    """Latency counts in logarithmic buckets about 5% wide, in constant memory."""
+
+    def __init__(self) -> None:
+        self.counts = {}
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        bucket = max(0, int(math.log(max(seconds, HISTOGRAM_MIN_SECONDS) / HISTOGRAM_MIN_SECONDS, HISTOGRAM_GROWTH)))
+        with self._lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.total += 1
+
+    def percentile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the ``q``-th percentile, or None when empty."""
+        with self._lock:
+            if self.total == 0:
+                return None
+            rank = q / 100 * self.total
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= rank:
+                    break
+        return HISTOGRAM_MIN_SECONDS * HISTOGRAM_GROWTH ** (bucket + 1)
+
+
+def latency_histogram(model: str, step: str | None) -> LatencyHistogram:
+    with _histograms_lock:
+        return _histograms.setdefault((model, step), LatencyHistogram())
+
+
+def record_latency(model: str, step: str | None, seconds: float) -> None:
+    """Add a time to first token (or to the whole response when not streaming) of ``model`` in ``step``."""
+    latency_histogram(model, step).add(seconds)
+
+
+def hedge_delay(options: dict, model: str, step: str | None) -> float | None:
+    """Seconds to wait for a first token from ``model`` before hedging, or None to never hedge.
+
+    ``options`` is a step's ``hedge`` section. Once ``min_samples`` latencies
+    of the model in the step are recorded, the delay is their ``percentile``;
+    until then it is ``after``. ``min`` and ``max`` clamp either.
+    """
+    histogram = latency_histogram(model, step)
+    if histogram.total >= options.get("min_samples", DEFAULT_HEDGE_MIN_SAMPLES):
+        delay = histogram.percentile(options.get("percentile", DEFAULT_HEDGE_PERCENTILE))
+    else:
+        delay = options.get("after")
+    if delay is None:
+        return None
+    if "min" in options:
+        delay = max(delay, options["min"])
+    if "max" in options:
+        delay = min(delay, options["max"])
+    return delay
+
+
+async def run_hedged(
+    calls: list[Callable[[], Awaitable]],
+    delays: list[float | None],
+    first_token: asyncio.Event,
+) -> tuple[int, object, int]:
+    """Run ``calls[0]`` and start the next call whenever hedging or failover is due.
+
+    The next call starts when none of the running calls has set
+    ``first_token`` within ``delays[i]`` seconds of starting call ``i`` (None
+    never hedges), or right away when every running call has failed. Returns
+    the index and result of the first call to finish successfully, and how
+    many calls were started; the others are cancelled. Raises the last error
+    when all calls fail.
+    """
+    tasks = {}  # task -> index of the call
+    errors = []
+    next_index = 0
+    launched_at = 0.0
+
+    def launch() -> None:
+        nonlocal next_index, launched_at
+        tasks[asyncio.create_task(calls[next_index]())] = next_index
+        launched_at = time.monotonic()
+        next_index += 1
+
+    launch()
+    try:
+        while tasks:
+            timeout = None
+            if next_index < len(calls) and not first_token.is_set() and delays[next_index - 1] is not None:
+                timeout = max(0.0, launched_at + delays[next_index - 1] - time.monotonic())
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if not first_token.is_set():
+                    logger.info(f"No first token after {delays[next_index - 1]:.1f}s, hedging with call {next_index}.")
+                    launch()
+                continue
+            for task in done:
+                index = tasks.pop(task)
+                if task.exception() is None:
+                    if index > 0:
+                        logger.info(f"Call {index} of the fallback chain won.")
+                    return index, task.result(), next_index
+                errors.append(task.exception())
+            if not tasks and next_index < len(calls):
+                logger.info(f"All running calls failed, falling back to call {next_index}.")
+                launch()
+        raise errors[-1]
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
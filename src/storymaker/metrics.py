@@ -0,0 +1,185 @@
+"""Per-call latency and token usage metrics and run reports."""
+
+import os
+import csv
+import json
+import math
+import argparse
+import logging
+from dataclasses import dataclass, asdict, fields
+
+REPORT_JSON_NAME = "run_report.json"
+REPORT_CSV_NAME = "run_report.csv"
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class CallMetrics:
+    step: str | None
+    model: str
+    started_at: float
+    response_id: str | None = None
+    finish_reason: str | None = None
+    wall_time: float = 0.0
+    ttft: float | None = None
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    reasoning_tokens: int | None = None
+    cached_tokens: int | None = None
+    cost: float | None = None
+    retries: int = 0
+    cache_hit: bool = False
+    deferred: bool = False
+    hedges: int = 0
+    ok: bool = True
+    error: str | None = None
+
+    def record_usage(self, usage) -> None:
+        """Copy token counts (and OpenRouter's ``cost``) from an API usage object."""
+        if usage is None:
+            return
+        self.prompt_tokens = usage.prompt_tokens
+        self.completion_tokens = usage.completion_tokens
+        if usage.completion_tokens_details is not None:
+            self.reasoning_tokens = usage.completion_tokens_details.reasoning_tokens
+        if usage.prompt_tokens_details is not None:
+            self.cached_tokens = usage.prompt_tokens_details.cached_tokens
+        self.cost = getattr(usage, "cost", None)
+
+
+class MetricsHook:
+    """Receives the metrics of every chat completion a maker makes."""
+
+    def on_call(self, metrics: CallMetrics) -> None:
+        raise NotImplementedError
+
+
+class MetricsRecorder(MetricsHook):
+    """Collects call metrics and writes them as a run report."""
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def on_call(self, metrics: CallMetrics) -> None:
+        self.calls.append(metrics)
+
+    def write_report(self, output_dir: str) -> None:
+        """Write ``run_report.json`` and ``run_report.csv`` into ``output_dir``.
+
+        The calls are appended to those of an existing report, so resumed
+        runs and reruns into the same directory keep the earlier metrics.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        report_path = os.path.join(output_dir, REPORT_JSON_NAME)
+        calls = []
+        if os.path.exists(report_path):
+            try:
+                with open(report_path, "r", encoding="utf-8") as f:
+                    calls = json.load(f)["calls"]
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Replacing unreadable run report {report_path}: {e}")
+        calls += [asdict(call) for call in self.calls]
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"calls": calls, "summary": summarize(calls)}, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(output_dir, REPORT_CSV_NAME), "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=[field.name for field in fields(CallMetrics)], extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(calls)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """``q``-th percentile (0 to 100) of ``values``, linearly interpolated between the closest ranks."""
+    if not 0 <= q <= 100:
+        raise ValueError(f"Percentile must be between 0 and 100, got {q}.")
+    if not values:
+        raise ValueError("Percentile of no values.")
+    ordered = sorted(values)
+    position = q / 100 * (len(ordered) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(calls: list[dict]) -> dict:
+    """Aggregate call metrics per step: call count, latency percentiles, tokens, prompt-cache hit rate and cost."""
+    by_step = {}
+    for call in calls:
+        by_step.setdefault(call["step"] or "-", []).append(call)
+
+    summary = {}
+    for step, step_calls in by_step.items():
+        wall_times = [call["wall_time"] for call in step_calls]
+        summary[step] = {
+            "calls": len(step_calls),
+            "failures": sum(1 for call in step_calls if not call["ok"]),
+            "cache_hits": sum(1 for call in step_calls if call["cache_hit"]),
+            "deferred": sum(1 for call in step_calls if call.get("deferred")),
+            "hedges": sum(call.get("hedges", 0) for call in step_calls),
+            "retries": sum(call["retries"] for call in step_calls),
+            "wall_time_total": sum(wall_times),
+            "wall_time_p50": percentile(wall_times, 50),
+            "wall_time_p95": percentile(wall_times, 95),
+            "prompt_tokens": sum(call["prompt_tokens"] or 0 for call in step_calls),
+            "completion_tokens": sum(call["completion_tokens"] or 0 for call in step_calls),
+            "reasoning_tokens": sum(call["reasoning_tokens"] or 0 for call in step_calls),
+            "cached_tokens": sum(call.get("cached_tokens") or 0 for call in step_calls),
+            "cost": sum(call["cost"] or 0 for call in step_calls),
+        }
+        prompt_tokens = summary[step]["prompt_tokens"]
+        summary[step]["cached_token_rate"] = summary[step]["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+    return summary
+
+
+def find_reports(paths: list[str]) -> list[str]:
+    reports = []
+    for path in paths:
+        if os.path.isfile(path):
+            reports.append(path)
+            continue
+        for dir_path, _, file_names in os.walk(path):
+            if REPORT_JSON_NAME in file_names:
+                reports.append(os.path.join(dir_path, REPORT_JSON_NAME))
+    return sorted(reports)
+
+
+def format_summary(summary: dict) -> str:
+    header = f"{'step':<22}{'calls':>7}{'fail':>6}{'p50 s':>9}{'p95 s':>9}{'total s':>10}{'prompt':>10}{'compl':>10}{'reason':>10}{'cached':>8}{'cost':>10}"
+    lines = [header, "-" * len(header)]
+    ordered = sorted(summary.items(), key=lambda item: item[1]["wall_time_total"], reverse=True)
+    for step, row in ordered:
+        lines.append(
+            f"{step:<22}{row['calls']:>7}{row['failures']:>6}{row['wall_time_p50']:>9.1f}{row['wall_time_p95']:>9.1f}"
+            f"{row['wall_time_total']:>10.1f}{row['prompt_tokens']:>10}{row['completion_tokens']:>10}"
+            f"{row['reasoning_tokens']:>10}{row.get('cached_token_rate', 0.0):>8.0%}{row['cost']:>10.4f}"
+        )
+    return "\n".join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Summarize run reports")
+    parser.add_argument(
+        "paths", nargs="+", help="Run report files or directories searched recursively for run_report.json"
+    )
+
+    if args is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(args)
+
+    calls = []
+    reports = find_reports(args.paths)
+    for report in reports:
+        with open(report, "r", encoding="utf-8") as f:
+            calls += json.load(f)["calls"]
+    if not calls:
+        print("No run reports found.")
+        return
+    print(f"{len(reports)} runs, {len(calls)} calls")
+    print(format_summary(summarize(calls)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""Local OpenAI-compatible stub server for offline benchmarks and tests."""
+
+import json
+import time
+import email
+import email.policy
+import hashlib
+import random
+import logging
+import threading
+import itertools
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class MockServerConfig:
+    latency: float = 0.05  # seconds before the first byte of every response
+    model_latency: dict = field(default_factory=dict)  # extra seconds before the first byte, by model
+    chunk_rate: float = 200.0  # streamed chunks per second
+    chunk_size: int = 20  # characters per streamed chunk
+    payload_size: int = 4000  # characters of generated text per completion
+    error_rate: float = 0.0  # fraction of requests answered with an error
+    error_status: int = 429
+    refusal_rate: float = 0.0  # fraction of structured output requests answered with a refusal
+    retry_after: float = 0.0  # Retry-After sent with injected errors
+    batch_latency: float = 1.0  # seconds a batch stays in progress
+    seed: int | None = None
+
+
+def _sample_from_schema(schema: dict, defs: dict):
+    """Smallest value satisfying a JSON schema as produced by pydantic."""
+    if "$ref" in schema:
+        return _sample_from_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        return _sample_from_schema(schema["anyOf"][0], defs)
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {name: _sample_from_schema(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [_sample_from_schema(schema.get("items", {}), defs) for _ in range(max(2, schema.get("minItems", 0)))]
+    if schema_type == "string":
+        return "モック"
+    if schema_type in ("integer", "number"):
+        return 0
+    if schema_type == "boolean":
+        return False
+    return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "MockServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict | None = None) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_bytes(self, status: int, payload: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("content-length", 0))
+        return self.rfile.read(length)
+
+    def _read_json(self) -> dict:
+        return json.loads(self._read_body() or b"{}")
+
+    def _read_form(self) -> dict:
+        """Fields of a multipart form; file fields as ``(filename, bytes)``."""
+        header = f"content-type: {self.headers.get('content-type')}\r\n\r\n".encode("utf-8")
+        message = email.message_from_bytes(header + self._read_body(), policy=email.policy.HTTP)
+        form = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True)
+            filename = part.get_filename()
+            form[name] = (filename, payload) if filename is not None else payload.decode("utf-8")
+        return form
+
+    def _path_parts(self) -> list[str]:
+        # Padded, so that short paths can be matched against the longer routes.
+        return ["", "", ""] + self.path.split("?")[0].rstrip("/").split("/")
+
+    def _not_found(self) -> None:
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts[-1] == "models":
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model", "created": 0, "owned_by": "mock"}]})
+        elif parts[-2] == "batches" and parts[-1] in self.server.batches:
+            self._send_json(200, self.server.batches[parts[-1]])
+        elif parts[-3] == "files" and parts[-1] == "content" and parts[-2] in self.server.files:
+            self._send_bytes(200, self.server.files[parts[-2]][1], "application/octet-stream")
+        elif parts[-2] == "files" and parts[-1] in self.server.files:
+            self._send_json(200, self.server.files[parts[-1]][0])
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        parts = self._path_parts()
+        if parts[-2:] == ["chat", "completions"]:
+            self._chat_completion()
+        elif parts[-1] == "files":
+            form = self._read_form()
+            filename, content = form["file"]
+            self._send_json(200, self.server.add_file(filename, content, form.get("purpose", "batch")))
+        elif parts[-1] == "batches":
+            body = self._read_json()
+            if body.get("input_file_id") not in self.server.files:
+                self._send_json(400, {"error": {"message": f"Unknown file {body.get('input_file_id')}"}})
+                return
+            self._send_json(200, self.server.create_batch(body))
+        elif parts[-3] == "batches" and parts[-1] == "cancel" and parts[-2] in self.server.batches:
+            self._send_json(200, self.server.cancel_batch(parts[-2]))
+        else:
+            self._not_found()
+
+    def _chat_completion(self) -> None:
+        body = self._read_json()
+        self.server.record_request()
+        config = self.server.config
+        time.sleep(config.latency + config.model_latency.get(body.get("model"), 0.0))
+        if self.server.should_fail():
+            headers = {"retry-after": str(config.retry_after)} if config.retry_after else None
+            self._send_json(config.error_status, {"error": {"message": "Injected error", "code": config.error_status}}, headers)
+            return
+
+        completion = self.server.chat_completion(body)
+        if body.get("stream"):
+            content = completion["choices"][0]["message"]["content"] or ""
+            self._stream(completion["id"], body["model"], content, completion["usage"])
+            return
+        self._send_json(200, completion)
+
+    def _stream(self, completion_id: str, model: str, content: str, usage: dict) -> None:
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.end_headers()
+
+        def send(chunk: dict) -> None:
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        for start in range(0, len(content), config.chunk_size):
+            delta = {"content": content[start : start + config.chunk_size]}
+            send({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            if config.chunk_rate > 0:
+                time.sleep(1 / config.chunk_rate)
+        send({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        send({**base, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    """OpenAI-compatible stub serving ``/v1/chat/completions``, ``/v1/models``
+    and the Batch API (``/v1/files`` and ``/v1/batches``).
+
+    Completions contain ``payload_size`` characters of Markdown text, or the
+    smallest object matching the requested JSON schema for structured output.
+    A batch completes ``batch_latency`` seconds after it is created.
+    Use it as a context manager, and point ``api_base_path`` at ``base_url``.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config: MockServerConfig | None = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__((host, port), _Handler)
+        self.config = config or MockServerConfig()
+        self.random = random.Random(self.config.seed)
+        self.ids = itertools.count(1)
+        self.request_count = 0
+        self.prompt_prefixes = set()
+        self.files = {}  # file_id -> (file object, content)
+        self.batches = {}  # batch_id -> batch object
+        self.batch_request_count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.request_count += 1
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self.random.random() < self.config.error_rate
+
+    def prompt_usage(self, messages: list[dict]) -> tuple[int, int]:
+        """Prompt length and the length of its longest previously seen cache-control prefix, in characters.
+
+        Mimics provider prompt caching: every content part marked with
+        ``cache_control`` ends a prefix that later requests can hit.
+        """
+        prefix = hashlib.sha256()
+        prompt_chars = 0
+        cached_chars = 0
+        with self._lock:
+            for message in messages:
+                content = message.get("content") or ""
+                parts = [{"text": content}] if isinstance(content, str) else content
+                for part in parts:
+                    text = part.get("text") or ""
+                    prefix.update(text.encode("utf-8"))
+                    prompt_chars += len(text)
+                    if "cache_control" not in part:
+                        continue
+                    digest = prefix.copy().hexdigest()
+                    if digest in self.prompt_prefixes:
+                        cached_chars = prompt_chars
+                    else:
+                        self.prompt_prefixes.add(digest)
+        return prompt_chars, cached_chars
+
+    def completion_content(self, body: dict) -> str:
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            return json.dumps(_sample_from_schema(schema, schema.get("$defs", {})), ensure_ascii=False)
+        paragraph = "静かな夜に、主人公は遠い街の灯りを見つめていた。"
+        text = ""
+        chapter = 1
+        while len(text) < self.config.payload_size:
+            text += f"## 第{chapter}章\n\n" + paragraph * 8 + "\n\n"
+            chapter += 1
+        return text[: self.config.payload_size]
+
+    def should_refuse(self, body: dict) -> bool:
+        if (body.get("response_format") or {}).get("type") != "json_schema":
+            return False
+        with self._lock:
+            return self.random.random() < self.config.refusal_rate
+
+    def chat_completion(self, body: dict) -> dict:
+        content = self.completion_content(body)
+        prompt_chars, cached_chars = self.prompt_usage(body.get("messages", []))
+        message = {"role": "assistant", "content": content}
+        if self.should_refuse(body):
+            message = {"role": "assistant", "content": None, "refusal": "モックは応答を拒否しました。"}
+            content = message["refusal"]
+        return {
+            "id": f"chatcmpl-mock-{next(self.ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_chars // 4 + len(content) // 4,
+                "prompt_tokens_details": {"cached_tokens": cached_chars // 4},
+            },
+        }
+
+    def add_file(self, filename: str, content: bytes, purpose: str) -> dict:
+        file_id = f"file-mock-{next(self.ids)}"
+        file_object = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self._lock:
+            self.files[file_id] = (file_object, content)
+        return file_object
+
+    def create_batch(self, body: dict) -> dict:
+        batch_id = f"batch-mock-{next(self.ids)}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "metadata": body.get("metadata"),
+        }
+        with self._lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self._run_batch, args=(batch_id,), daemon=True).start()
+        return batch
+
+    def cancel_batch(self, batch_id: str) -> dict:
+        with self._lock:
+            batch = self.batches[batch_id]
+            if batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+                batch["status"] = "cancelled"
+                batch["cancelled_at"] = int(time.time())
+            return batch
+
+    def _run_batch(self, batch_id: str) -> None:
+        """Answer every request line of a batch, honoring ``error_rate``, after ``batch_latency`` seconds."""
+        time.sleep(self.config.batch_latency)
+        batch = self.batches[batch_id]
+        outputs = []
+        errors = []
+        for line in self.files[batch["input_file_id"]][1].decode("utf-8").splitlines():
+            if line.strip() == "":
+                continue
+            request = json.loads(line)
+            with self._lock:
+                self.batch_request_count += 1
+            line = {"id": f"batch-req-{next(self.ids)}", "custom_id": request["custom_id"], "error": None}
+            if self.should_fail():
+                body = {"error": {"message": "Injected error"}}
+                errors.append({**line, "response": {"status_code": self.config.error_status, "body": body}})
+                continue
+            outputs.append({**line, "response": {"status_code": 200, "body": self.chat_completion(request["body"])}})
+        updates = {
+            "status": "completed",
+            "completed_at": int(time.time()),
+            "request_counts": {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)},
+        }
+        for key, lines in (("output_file_id", outputs), ("error_file_id", errors)):
+            if lines:
+                content = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+                updates[key] = self.add_file(f"{batch_id}_{key}.jsonl", content, "batch_output")["id"]
+        with self._lock:
+            if batch["status"] != "cancelled":
+                batch.update(updates)
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="storymaker-mock-server", daemon=True)
+        self._thread.start()
+        logger.info(f"Mock server listening on {self.base_url}.")
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
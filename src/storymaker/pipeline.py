@@ -0,0 +1,75 @@
+"""Dependency graph of pipeline stages and a scheduler that runs them concurrently."""
+
+import asyncio
+import inspect
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class Stage:
+    """One node of the pipeline graph.
+
+    ``func`` receives the results of all finished stages keyed by stage name
+    and may return an awaitable. Set ``blocking`` for plain synchronous work
+    (file I/O) so it runs in a thread instead of stalling the event loop.
+    """
+
+    name: str
+    func: Callable[[dict], Any]
+    deps: tuple[str, ...] = ()
+    blocking: bool = False
+
+
+async def _run_stage(stage: Stage, results: dict) -> Any:
+    logger.info(f"Starting stage {stage.name}...")
+    if stage.blocking:
+        result = await asyncio.to_thread(stage.func, results)
+    else:
+        result = stage.func(results)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def run_stages(stages: list[Stage]) -> dict:
+    """Run every stage as soon as all of its dependencies have finished.
+
+    Returns the results keyed by stage name. If a stage fails, the stages
+    still running are cancelled and the error is raised.
+    """
+    names = [stage.name for stage in stages]
+    if len(names) != len(set(names)):
+        raise ValueError("Stage names must be unique.")
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in names:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}.")
+
+    results = {}
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+    while pending or running:
+        for name, stage in list(pending.items()):
+            if all(dep in results for dep in stage.deps):
+                del pending[name]
+                running[asyncio.create_task(_run_stage(stage, results))] = name
+        if not running:
+            raise ValueError(f"Stages {sorted(pending)} have cyclic dependencies.")
+
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            name = running.pop(task)
+            try:
+                results[name] = task.result()
+            except BaseException:
+                for other in running:
+                    other.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+                raise
+    return results
@@ -0,0 +1,190 @@
+"""Rate limiting and retries for API requests."""
+
+import time
+import random
+import asyncio
+import logging
+import threading
+import email.utils
+from typing import Awaitable, Callable, TypeVar
+
+import openai
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Token bucket refilled at ``per_minute`` units per minute.
+
+    ``acquire`` reserves units immediately and then sleeps until the bucket
+    would have held them, so concurrent callers queue up in arrival order
+    instead of failing. The state is guarded by a thread lock, which lets one
+    bucket be shared by pipelines running on different event loops.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` units and return how many seconds the caller must wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.available -= min(amount, self.capacity)
+            return max(0.0, -self.available / self.rate)
+
+    async def acquire(self, amount: float) -> None:
+        wait = self.reserve(amount)
+        if wait > 0:
+            logger.info(f"Rate limit reached, waiting {wait:.1f}s.")
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket so that nothing is granted for ``seconds``."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.available = min(self.available, -seconds * self.rate)
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Delay requested by the server through ``Retry-After`` / ``retry-after-ms``, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        value = headers["retry-after"]
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            retry_date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            # Neither seconds nor an HTTP date, e.g. from a misbehaving proxy: use the normal backoff.
+            return None
+        if retry_date is not None:
+            return max(0.0, retry_date.timestamp() - time.time())
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+class RequestScheduler:
+    """Per-model request and token limits plus retries with exponential backoff.
+
+    ``rate_limits`` and ``retry`` are the manuscript sections of the same name::
+
+        "rate_limits": {
+            "default": {"requests_per_minute": 60, "tokens_per_minute": 1000000},
+            "google/gemini-3-pro-preview": {"requests_per_minute": 20},
+        },
+        "retry": {"max_retries": 5, "base_delay": 1, "max_delay": 60},
+    """
+
+    def __init__(self, rate_limits: dict | None = None, retry: dict | None = None) -> None:
+        self.rate_limits = rate_limits or {}
+        retry = retry or {}
+        self.max_retries = retry.get("max_retries", DEFAULT_MAX_RETRIES)
+        self.base_delay = retry.get("base_delay", DEFAULT_BASE_DELAY)
+        self.max_delay = retry.get("max_delay", DEFAULT_MAX_DELAY)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, model: str, kind: str) -> TokenBucket | None:
+        with self._lock:
+            if (model, kind) not in self._buckets:
+                limits = self.rate_limits.get(model, self.rate_limits.get("default", {}))
+                per_minute = limits.get(kind)
+                self._buckets[(model, kind)] = TokenBucket(per_minute) if per_minute else None
+            return self._buckets[(model, kind)]
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def record_usage(self, model: str, tokens: int) -> None:
+        """Charge tokens that were only known after the response (completion tokens)."""
+        token_bucket = self._bucket(model, "tokens_per_minute")
+        if token_bucket is not None and tokens > 0:
+            token_bucket.reserve(tokens)
+
+    async def run(
+        self,
+        model: str,
+        prompt_tokens: int,
+        call: Callable[[], Awaitable[T]],
+        on_retry: Callable[[Exception], None] | None = None,
+    ) -> T:
+        """Run ``call`` within the model's rate limits, retrying transient errors.
+
+        ``on_retry`` is called with the error before every retry.
+        """
+        request_bucket = self._bucket(model, "requests_per_minute")
+        token_bucket = self._bucket(model, "tokens_per_minute")
+        attempt = 0
+        while True:
+            if request_bucket is not None:
+                await request_bucket.acquire(1)
+            if token_bucket is not None:
+                await token_bucket.acquire(prompt_tokens)
+            try:
+                return await call()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt, e)
+                if request_bucket is not None and isinstance(e, openai.RateLimitError):
+                    request_bucket.pause(delay)
+                attempt += 1
+                if on_retry is not None:
+                    on_retry(e)
+                logger.warning(
+                    f"Request to {model} failed ({e.__class__.__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s."
+                )
+                await asyncio.sleep(delay)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(base_url: str, rate_limits: dict | None = None, retry: dict | None = None) -> RequestScheduler:
+    """Return the process-wide scheduler for ``base_url`` and the given configuration."""
+    key = (base_url, repr(rate_limits), repr(retry))
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = RequestScheduler(rate_limits, retry)
+        return _schedulers[key]
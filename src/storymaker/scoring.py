@@ -0,0 +1,38 @@
+"""Cheap scoring of candidate story drafts."""
+
+import re
+import logging
+
+DEFAULT_TARGET_CHARS = 3000
+HEADING_PATTERN = re.compile(r"^#{1,6}\s+\S", re.MULTILINE)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+def score_draft(draft: str, target_chars: int = DEFAULT_TARGET_CHARS) -> float:
+    """Score a draft between 0 and 1 from its length, structure and repetition.
+
+    - length: closeness of the character count to ``target_chars``
+    - structure: number of Markdown headings, saturating at five sections
+    - repetition: share of non-empty lines that are unique
+    """
+    text = draft.strip()
+    if not text:
+        return 0.0
+    length_score = min(len(text) / target_chars, target_chars / len(text))
+    structure_score = min(len(HEADING_PATTERN.findall(text)) / 5, 1.0)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    repetition_score = len(set(lines)) / len(lines)
+    return 0.6 * length_score + 0.25 * structure_score + 0.15 * repetition_score
+
+
+def format_drafts(drafts: list[str]) -> str:
+    """Number the drafts as Markdown sections for a scoring prompt."""
+    return "\n\n".join(f"## 候補{i}\n\n{draft}" for i, draft in enumerate(drafts, start=1))
+
+
+def best_index(scores: list[float]) -> int:
+    """Index of the highest score; the earliest draft wins ties."""
+    return max(range(len(scores)), key=lambda i: (scores[i], -i))
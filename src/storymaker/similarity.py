@@ -0,0 +1,104 @@
+"""Text normalization, shingle similarity and MinHash signatures for duplicate detection and change measurement."""
+
+import re
+import hashlib
+import unicodedata
+
+DEFAULT_SHINGLE_SIZE = 5
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+DEFAULT_MINHASH_BINS = 128
+# Added per bin of distance when an empty bin borrows the value of the next filled one.
+_DENSIFY_STEP = 0x9E3779B97F4A7C15
+
+
+def normalize_text(text: str) -> str:
+    """NFKC-normalize, lowercase and drop whitespace, so layout differences do not matter."""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text)).lower()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def shingles(text: str, size: int = DEFAULT_SHINGLE_SIZE) -> set[str]:
+    """Character ``size``-grams of the normalized text (characters suit Japanese, which has no spaces)."""
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i : i + size] for i in range(len(normalized) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def find_duplicates(texts: list[str], threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> list[int | None]:
+    """For every text, the index of an earlier text it duplicates, or None.
+
+    Identical texts (after normalization) match by hash; the others by the
+    Jaccard similarity of their shingles reaching ``threshold``. Pairwise
+    comparison suits a few thousand texts per run.
+    """
+    duplicate_of = []
+    first_by_hash = {}
+    originals = []
+    for i, text in enumerate(texts):
+        digest = text_hash(text)
+        if digest in first_by_hash:
+            duplicate_of.append(first_by_hash[digest])
+            continue
+        first_by_hash[digest] = i
+        text_shingles = shingles(text)
+        match = None
+        for j, original_shingles in originals:
+            if jaccard(text_shingles, original_shingles) >= threshold:
+                match = j
+                break
+        duplicate_of.append(match)
+        if match is None:
+            originals.append((i, text_shingles))
+    return duplicate_of
+
+
+def text_change(before: str, after: str, size: int = DEFAULT_SHINGLE_SIZE) -> tuple[float, float]:
+    """How much ``after`` differs from ``before``: the diff ratio and the relative length change.
+
+    The diff ratio is one minus the Jaccard similarity of the shingles, 0.0
+    for identical texts and 1.0 for texts without a shared shingle. Unlike an
+    alignment diff it stays linear in the text length.
+    """
+    diff_ratio = 1.0 - jaccard(shingles(before, size), shingles(after, size))
+    before_length = len(normalize_text(before))
+    length_delta = abs(len(normalize_text(after)) - before_length) / max(before_length, 1)
+    return diff_ratio, length_delta
+
+
+def minhash_signature(text: str, num_bins: int = DEFAULT_MINHASH_BINS, size: int = DEFAULT_SHINGLE_SIZE) -> list[int]:
+    """One-permutation MinHash of the text's shingles, linear in the text length.
+
+    Every shingle hash falls into one of ``num_bins`` bins, which keep their
+    minimum. Empty bins borrow from the next filled bin (rotation
+    densification), so short texts still get a full signature. The share of
+    equal entries of two signatures estimates the Jaccard similarity.
+    """
+    mins = [None] * num_bins
+    for shingle in shingles(text, size):
+        digest = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        bin_index, value = digest % num_bins, digest // num_bins
+        if mins[bin_index] is None or value < mins[bin_index]:
+            mins[bin_index] = value
+    signature = list(mins)
+    for i in range(num_bins):
+        distance = 1
+        while signature[i] is None:
+            borrowed = mins[(i + distance) % num_bins]
+            if borrowed is not None:
+                signature[i] = (borrowed + distance * _DENSIFY_STEP) % 2**64
+            distance += 1
+    return signature
+
+
+def signature_similarity(a: list[int], b: list[int]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
@@ -0,0 +1,61 @@
+"""Prompt templates parsed once and rendered in a single pass."""
+
+import re
+import functools
+
+from storymaker.utils import read_prompt
+
+PLACEHOLDER_PATTERN = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+class PromptTemplate:
+    """Prompt text with ``{name}`` placeholders.
+
+    The text is split into literals and placeholders once, so rendering is a
+    single join. Substituted values are never scanned again: a ``{genre}``
+    inside the story text stays as it is.
+    """
+
+    def __init__(self, text: str, name: str | None = None) -> None:
+        self.name = name
+        self._parts = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self._parts.append((False, text[position : match.start()]))
+            self._parts.append((True, match.group(1)))
+            position = match.end()
+        self._parts.append((False, text[position:]))
+        self.variables = frozenset(value for is_placeholder, value in self._parts if is_placeholder)
+
+    def render(self, allow_extra: bool = False, **values: str) -> str:
+        """Fill every placeholder. Missing values, and unused values unless ``allow_extra``, raise ValueError."""
+        missing = self.variables - values.keys()
+        if missing:
+            raise ValueError(f"Missing values for prompt {self.name}: {sorted(missing)}")
+        extra = values.keys() - self.variables
+        if extra and not allow_extra:
+            raise ValueError(f"Prompt {self.name} has no placeholders for: {sorted(extra)}")
+        return "".join(values[value] if is_placeholder else value for is_placeholder, value in self._parts)
+
+    def render_segments(self, allow_extra: bool = False, stable: tuple[str, ...] = (), **values: str) -> list[str]:
+        """Render as ``[stable prefix, rest]`` so providers can cache the prefix.
+
+        The prefix runs up to the first placeholder not named in ``stable``
+        (values shared by many calls, such as an outline); it is omitted when
+        empty. Joining the segments gives ``render(...)``.
+        """
+        rendered = self.render(allow_extra, **values)
+        prefix_length = 0
+        for is_placeholder, value in self._parts:
+            if is_placeholder and value not in stable:
+                break
+            prefix_length += len(values[value]) if is_placeholder else len(value)
+        if prefix_length in (0, len(rendered)):
+            return [rendered]
+        return [rendered[:prefix_length], rendered[prefix_length:]]
+
+
+@functools.lru_cache(maxsize=None)
+def get_prompt_template(filename: str) -> PromptTemplate:
+    """Load and parse a packaged prompt once per process."""
+    return PromptTemplate(read_prompt(filename), filename)
@@ -1,15 +1,20 @@
 import os
 import re
+import copy
 import json
+import atexit
+import asyncio
 import logging
+import functools
+import threading
+import importlib.resources
 
 import json5
 import tiktoken
 from dotenv import load_dotenv
-import pkg_resources
 
-logger = logging.getLoger(__name__.main)
-logger.addHabdler(logging.StreamHandler())
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.INFO)
 
 def load_markdown_as_prompt(file_path: str) -> str:
@@ -35,17 +40,67 @@ models_encoding = {
     "google/gemini-3-pro-preview": "o200k_base",
 }
 
-def count_tokens(text: str, model: str) -> int:
+# CJK characters are roughly one token each; other text is roughly four characters per token.
+CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+APPROX_CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _load_encoding(encoding_name: str):
+    return tiktoken.get_encoding(encoding_name)
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding_name(model: str) -> str | None:
+    """Name of the tiktoken encoding for ``model``, or None if tiktoken does not know the model."""
+    if model in models_encoding:
+        return models_encoding[model]
+    # OpenRouter ids look like "openai/gpt-4o"; tiktoken only knows the bare name.
+    for name in (model, model.split("/")[-1]):
+        try:
+            return tiktoken.encoding_name_for_model(name)
+        except KeyError:
+            pass
+    logger.warning(f"No tokenizer available for model {model}, falling back to an estimate.")
+    return None
+
+
+def get_encoding(model: str):
+    """Return the (process-wide cached) tiktoken encoding for ``model``, or None if it is unavailable.
+
+    Only loaded encodings and unknown models are cached: when loading fails,
+    e.g. because the encoding file cannot be downloaded, this call falls back
+    to an estimate and the next one tries again.
+    """
+    encoding_name = _encoding_name(model)
+    if encoding_name is None:
+        return None
     try:
-        if model in models_encoding:
-            encoding = tiktoken.get_encoding(models_encoding[model])
-        else:
-            encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
+        return _load_encoding(encoding_name)
     except Exception as e:
-        logger.info("Unknow model name provided:", e)
-        logger.info("Returns 0")
-        return 0
+        logger.warning(f"Loading tokenizer {encoding_name} for model {model} failed, falling back to an estimate: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count for models without a known tokenizer."""
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + -(-(len(text) - cjk_count) // APPROX_CHARS_PER_TOKEN)
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens_batch(texts: list[str], model: str) -> list[int]:
+    """Count tokens of many texts in one call, encoding them in parallel threads."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return [estimate_tokens(text) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=())]
 
 
 def count_tokens_from_file(file_path: str, model: str) -> int:
@@ -54,18 +109,31 @@ def count_tokens_from_file(file_path: str, model: str) -> int:
     return count_tokens(text, model)
 
 
-def load_api_key(filepath: str, service: str = "OPENROUTER_API_KEY"):
-    if os.path.exists(filepath):
+def _file_mtime(file_path: str | None) -> int | None:
+    if file_path is None or not os.path.exists(file_path):
+        return None
+    return os.stat(file_path).st_mtime_ns
+
+
+@functools.lru_cache(maxsize=None)
+def _load_dotenv_once(filepath: str | None, mtime: int | None) -> None:
+    if mtime is not None:
         load_dotenv(filepath)
     else:
         load_dotenv()
+
+
+def load_api_key(filepath: str, service: str = "OPENROUTER_API_KEY"):
+    # The .env file is only parsed again when it has changed on disk.
+    _load_dotenv_once(filepath, _file_mtime(filepath))
     return os.getenv(service)
 
 
 def get_prompt_path(filename):
-    return pkg_resources.resource_filename("storymaker", os.path.join("prompt", filename))
+    return str(importlib.resources.files("storymaker").joinpath("prompt").joinpath(filename))
 
 
+@functools.lru_cache(maxsize=None)
 def read_prompt(filename):
     prompt_path = get_prompt_path(filename)
     with open(prompt_path, "r", encoding="utf-8") as f:
@@ -75,7 +143,86 @@ def no_heading_story(story: str) -> str:
     # remove all heading lines starting with # (# abc, ## abc, ### abc, etc.)
     return re.sub(r"^#+ .*\n", "", story, flags=re.MULTILINE)
 
-def load_manuscript(file_path: str) -> dict:
+def split_story_sections(story: str) -> list[str]:
+    # split before every heading line (the lines no_heading_story removes)
+    starts = [match.start() for match in re.finditer(r"^#+ ", story, flags=re.MULTILINE)]
+    if not starts or starts[0] != 0:
+        starts = [0] + starts
+    sections = []
+    pending = ""
+    for start, end in zip(starts, starts[1:] + [len(story)]):
+        section = (pending + "\n\n" + story[start:end].strip()).strip()
+        # a bare heading (e.g. the title above the first chapter) is kept with the next section
+        pending = section if not section.partition("\n")[2].strip() and re.match(r"#+ ", section) else ""
+        if not pending and section:
+            sections.append(section)
+    if pending:
+        sections.append(pending)
+    return sections
+
+def story_outline(sections: list[str], excerpt_chars: int = 200) -> str:
+    # headings and the opening of each section, shared as context when sections are enhanced separately
+    lines = []
+    for i, section in enumerate(sections, start=1):
+        heading, _, body = section.partition("\n")
+        if not re.match(r"#+ ", heading):
+            heading, body = f"セクション{i}", section
+        excerpt = re.sub(r"^#+ ", "", body.strip(), flags=re.MULTILINE).replace("\n", "")[:excerpt_chars]
+        lines.append(f"{i}. {heading.lstrip('#').strip()}: {excerpt}")
+    return "\n".join(lines)
+
+@functools.lru_cache(maxsize=32)
+def _parse_manuscript(file_path: str, mtime: int | None) -> dict:
     with open(file_path, "r") as file:
         # return as dict
         return json5.load(file)
+
+
+def load_manuscript(file_path: str) -> dict:
+    # Parsed manuscripts are cached per file version; every caller gets its own copy.
+    return copy.deepcopy(_parse_manuscript(file_path, _file_mtime(file_path)))
+
+
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_sync_loop.run_forever, name="storymaker-sync-loop", daemon=True)
+            thread.start()
+            atexit.register(_close_sync_loop, _sync_loop)
+        return _sync_loop
+
+
+def _close_sync_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """Close the API clients of the sync loop and stop it, at interpreter exit."""
+    from storymaker.clients import CLOSE_TIMEOUT, aclose_clients
+
+    if not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(aclose_clients(), loop).result(CLOSE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Error closing API clients of the sync loop: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def run_sync(coro):
+    """Run a coroutine to completion from synchronous code.
+
+    Every synchronous call is executed on one background event loop, so async
+    clients created there (and their connection pools) are reused across calls.
+    """
+    loop = _get_sync_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from the storymaker sync loop; await the coroutine instead.")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
@@ -0,0 +1,331 @@
+"""Long-running worker service that serves story and character jobs from a SQLite queue."""
+
+import os
+import json
+import time
+import signal
+import socket
+import sqlite3
+import asyncio
+import argparse
+import logging
+import threading
+from dataclasses import dataclass, asdict
+
+from storymaker.utils import load_markdown_as_prompt, load_manuscript, get_encoding
+from storymaker.clients import closing_clients
+from storymaker.create_story import StoryMaker
+from storymaker.create_character import CharacterMaker
+
+DEFAULT_QUEUE_PATH = ".storymaker_queue/jobs.sqlite3"
+DEFAULT_WORKERS = 4
+DEFAULT_POLL_INTERVAL = 1.0
+JOB_KINDS = ("story", "character")
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    params: dict
+    status: str
+    attempts: int
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    worker: str | None = None
+    error: str | None = None
+
+
+class JobQueue:
+    """Jobs stored in a SQLite file, shared by submitting processes and workers.
+
+    A job moves from ``queued`` to ``running`` when a worker claims it, then to
+    ``done`` or ``failed``. Claims run in an immediate transaction, so several
+    worker processes can serve the same queue.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH) -> None:
+        self.path = path
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, params TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL, worker TEXT, error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _job(self, row: tuple) -> Job:
+        id, kind, params, *rest = row
+        return Job(id, kind, json.loads(params), *rest)
+
+    def enqueue(self, kind: str, params: dict) -> int:
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind}, expected one of {JOB_KINDS}.")
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, params, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (kind, json.dumps(params, ensure_ascii=False), time.time()),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker: str) -> Job | None:
+        """Mark the oldest queued job as running by ``worker`` and return it."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, worker = ? "
+                    "WHERE id = ?",
+                    (time.time(), worker, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def finish(self, job_id: int, error: str | None = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                ("failed" if error else "done", time.time(), error, job_id),
+            )
+
+    def requeue(self, job_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL WHERE id = ?", (job_id,)
+            )
+
+    def requeue_stale(self) -> int:
+        """Put running jobs back into the queue after their worker process died.
+
+        Only call it while no worker serves the queue.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL WHERE status = 'running'"
+            )
+            return cursor.rowcount
+
+    def get(self, job_id: int) -> Job | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def list(self, status: str | None = None) -> list[Job]:
+        with self._lock:
+            if status is None:
+                rows = self._conn.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+            else:
+                rows = self._conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class WorkerService:
+    """``workers`` coroutines serving a job queue with warm, reused makers.
+
+    Each worker keeps its own ``StoryMaker`` and ``CharacterMaker`` for the
+    life of the process (both reset their per-job state), so clients,
+    connection pools, parsed prompts and tokenizers are set up once.
+    ``stop`` (bound to SIGINT and SIGTERM) lets running jobs finish and then
+    returns from ``run``.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        manuscript_path: str,
+        env_path: str,
+        workers: int = DEFAULT_WORKERS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        exit_when_empty: bool = False,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+        self.queue = queue
+        self.manuscript_path = manuscript_path
+        self.env_path = env_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.exit_when_empty = exit_when_empty
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = None
+        self._tasks = None
+
+    def stop(self) -> None:
+        """Finish running jobs and exit; a second call cancels them and requeues their jobs."""
+        if self._stopping is None:
+            return
+        if not self._stopping.is_set():
+            logger.info("Stopping workers after their running jobs (interrupt again to cancel them)...")
+            self._stopping.set()
+        elif self._tasks is not None:
+            logger.info("Cancelling running jobs...")
+            self._tasks.cancel()
+
+    async def run_job(self, job: Job, story_maker: StoryMaker, character_maker: CharacterMaker) -> None:
+        params = dict(job.params)
+        if job.kind == "story":
+            characters = params.pop("characters", None)
+            if characters is None:
+                characters = load_markdown_as_prompt(params.pop("input"))
+            output_dir = params.pop("output_dir")
+            resume = params.pop("resume", job.attempts > 1)
+            await story_maker.aprocess_steps(characters, output_dir, resume, **params)
+        else:
+            news = params.pop("news", None)
+            if news is None:
+                news = load_markdown_as_prompt(params.pop("input"))
+            output_path = params.pop("output")
+            await character_maker.aprocess_steps(news, output_path, **params)
+
+    async def _worker(self, index: int) -> None:
+        worker_name = f"{self.name}/{index}"
+        story_maker = StoryMaker(self.manuscript_path, self.env_path)
+        character_maker = CharacterMaker(self.manuscript_path, self.env_path)
+        while not self._stopping.is_set():
+            job = await asyncio.to_thread(self.queue.claim, worker_name)
+            if job is None:
+                if self.exit_when_empty:
+                    return
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info(f"Worker {index} starting {job.kind} job {job.id}...")
+            start = time.perf_counter()
+            try:
+                await self.run_job(job, story_maker, character_maker)
+            except asyncio.CancelledError:
+                await asyncio.to_thread(self.queue.requeue, job.id)
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                await asyncio.to_thread(self.queue.finish, job.id, repr(e))
+                continue
+            await asyncio.to_thread(self.queue.finish, job.id)
+            logger.info(f"Worker {index} finished job {job.id} in {time.perf_counter() - start:.1f}s.")
+
+    def warm_up(self) -> None:
+        """Load the tokenizers of every model in the manuscript before taking jobs."""
+        for section in load_manuscript(self.manuscript_path).values():
+            if isinstance(section, dict) and "model" in section:
+                get_encoding(section["model"])
+
+    async def run(self) -> None:
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        await asyncio.to_thread(self.warm_up)
+        logger.info(f"Serving {self.queue.path} with {self.workers} workers.")
+        self._tasks = asyncio.gather(*(self._worker(i) for i in range(self.workers)))
+        try:
+            await self._tasks
+        except asyncio.CancelledError:
+            if not self._stopping.is_set():
+                raise
+        finally:
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.remove_signal_handler(signal_number)
+                except (NotImplementedError, RuntimeError):
+                    pass
+        logger.info(f"Workers stopped, queue: {self.queue.counts()}.")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Serve story and character jobs from a local queue")
+    parser.add_argument("--queue", "-q", type=str, default=DEFAULT_QUEUE_PATH, help="Queue database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run workers until interrupted")
+    serve_parser.add_argument("--manuscript", "-m", type=str, required=False, help="Manuscript file")
+    serve_parser.add_argument("--env", "-e", type=str, required=False, help="Environment file")
+    serve_parser.add_argument("--workers", "-w", type=int, default=DEFAULT_WORKERS, help="Concurrent jobs")
+    serve_parser.add_argument(
+        "--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between polls of an empty queue"
+    )
+    serve_parser.add_argument("--exit-when-empty", action="store_true", help="Stop once the queue is drained")
+
+    submit_parser = subparsers.add_parser("submit", help="Add a job to the queue")
+    submit_parser.add_argument("kind", choices=JOB_KINDS, help="Job kind")
+    submit_parser.add_argument("--input", "-i", type=str, required=True, help="Input news or character file")
+    submit_parser.add_argument(
+        "--output", "-o", type=str, required=True, help="Output file (character) or directory (story)"
+    )
+    submit_parser.add_argument("--genre", "-g", type=str, required=False, help="Genre of the story")
+
+    subparsers.add_parser("requeue", help="Requeue jobs left running by a killed worker (stop all workers first)")
+
+    status_parser = subparsers.add_parser("status", help="Show queue counts or one job")
+    status_parser.add_argument("job_id", type=int, nargs="?", help="Job to show")
+
+    if args is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(args)
+
+    queue = JobQueue(args.queue)
+    if args.command == "serve":
+        service = WorkerService(
+            queue, args.manuscript, args.env, args.workers, args.poll_interval, args.exit_when_empty
+        )
+        asyncio.run(closing_clients(service.run()))
+    elif args.command == "submit":
+        params = {"input": os.path.abspath(args.input)}
+        if args.kind == "story":
+            params["output_dir"] = os.path.abspath(args.output)
+        else:
+            params["output"] = os.path.abspath(args.output)
+        if args.genre is not None:
+            params["genre"] = args.genre
+        print(queue.enqueue(args.kind, params))
+    elif args.command == "requeue":
+        print(queue.requeue_stale())
+    elif args.job_id is not None:
+        job = queue.get(args.job_id)
+        if job is None:
+            print(f"No job {args.job_id}.")
+        else:
+            print(json.dumps(asdict(job), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(queue.counts(), indent=2))
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
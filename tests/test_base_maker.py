@@ -0,0 +1,53 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+import json5
+
+from storymaker.base_maker import BaseMaker
+from storymaker.classmodel import NovelFrontmatter
+from storymaker.mock_server import MockServer, MockServerConfig
+
+
+class StructuredOutputCacheTest(unittest.TestCase):
+    def make_maker(self, server: MockServer, work_dir: str) -> BaseMaker:
+        manuscript = {
+            "api_base_path": server.base_url,
+            "cache": {"path": os.path.join(work_dir, "responses.sqlite3")},
+            "frontmatter": {"model": "mock/frontmatter", "temperature": 0, "top_p": 0},
+            "retry": {"max_retries": 0},
+        }
+        manuscript_path = os.path.join(work_dir, "manuscript.json5")
+        with open(manuscript_path, "w", encoding="utf-8") as f:
+            json5.dump(manuscript, f)
+        env_path = os.path.join(work_dir, ".env")
+        with open(env_path, "w", encoding="utf-8") as f:
+            f.write("OPENROUTER_API_KEY=mock\n")
+        return BaseMaker(manuscript_path, env_path)
+
+    def create_frontmatter(self, maker: BaseMaker):
+        return asyncio.run(
+            maker.acreate_chat_completion(
+                "story", "system", step="frontmatter", model="mock/frontmatter", response_format=NovelFrontmatter
+            )
+        )
+
+    def test_refusal_is_returned_as_none_and_not_cached(self):
+        config = MockServerConfig(latency=0, refusal_rate=1.0)
+        with MockServer(config) as server, tempfile.TemporaryDirectory() as work_dir:
+            maker = self.make_maker(server, work_dir)
+            self.assertIsNone(self.create_frontmatter(maker))
+
+            server.config.refusal_rate = 0.0
+            frontmatter = self.create_frontmatter(maker)
+            self.assertIsInstance(frontmatter, NovelFrontmatter)
+            self.assertEqual(server.request_count, 2)
+
+            # Only the parsed result was cached.
+            self.assertEqual(self.create_frontmatter(maker), frontmatter)
+            self.assertEqual(server.request_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
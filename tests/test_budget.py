@@ -0,0 +1,33 @@
+import tempfile
+import unittest
+
+from storymaker.budget import TokenBudget
+from storymaker.metrics import CallMetrics, MetricsRecorder
+
+
+class LearnedBudgetTest(unittest.TestCase):
+    def test_rejects_percentile_out_of_range(self):
+        for q in (-5, 101):
+            budget = TokenBudget({"enhance_story1": {"budget": {"policy": "learned", "history": [], "percentile": q}}})
+            with self.assertRaises(ValueError):
+                budget.completion_tokens("enhance_story1", "openai/gpt-4o", 1000, 20000)
+
+    def test_falls_back_without_history(self):
+        budget = TokenBudget({"enhance_story1": {"budget": {"policy": "learned", "history": [], "percentile": 100}}})
+        self.assertEqual(budget.completion_tokens("enhance_story1", "openai/gpt-4o", 1000, 20000), 20000)
+
+    def test_percentile_100_uses_the_largest_ratio(self):
+        with tempfile.TemporaryDirectory() as history:
+            recorder = MetricsRecorder()
+            for completion_tokens in (1000, 2000, 3000, 4000, 5000):
+                recorder.on_call(
+                    CallMetrics("enhance_story1", "mock", 0.0, prompt_tokens=1000, completion_tokens=completion_tokens)
+                )
+            recorder.write_report(history)
+            policy = {"policy": "learned", "history": [history], "percentile": 100, "margin": 1.0}
+            budget = TokenBudget({"enhance_story1": {"budget": policy}})
+            self.assertEqual(budget.completion_tokens("enhance_story1", "openai/gpt-4o", 1000, 20000), 5000)
+
+
+if __name__ == "__main__":
+    unittest.main()
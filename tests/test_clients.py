@@ -0,0 +1,42 @@
+import os
+import asyncio
+import tempfile
+import unittest
+import warnings
+
+import json5
+import openai
+
+from storymaker.base_maker import BaseMaker
+from storymaker.clients import closing_clients, get_async_client
+
+
+class SharedClientTest(unittest.TestCase):
+    def test_closing_clients_closes_the_clients_of_the_loop(self):
+        async def use_client() -> openai.AsyncOpenAI:
+            client = get_async_client("http://127.0.0.1:1/v1", "mock")
+            self.assertIs(get_async_client("http://127.0.0.1:1/v1", "mock"), client)
+            return client
+
+        client = asyncio.run(closing_clients(use_client()))
+        self.assertTrue(client.is_closed())
+
+    def test_deprecated_sync_client(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            manuscript_path = os.path.join(work_dir, "manuscript.json5")
+            with open(manuscript_path, "w", encoding="utf-8") as f:
+                json5.dump({"api_base_path": "http://127.0.0.1:1/v1"}, f)
+            env_path = os.path.join(work_dir, ".env")
+            with open(env_path, "w", encoding="utf-8") as f:
+                f.write("OPENROUTER_API_KEY=mock\n")
+            maker = BaseMaker(manuscript_path, env_path)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                client = maker.client
+            self.assertIsInstance(client, openai.OpenAI)
+            self.assertIs(maker.client, client)
+            self.assertTrue(any(issubclass(warning.category, DeprecationWarning) for warning in caught))
+
+
+if __name__ == "__main__":
+    unittest.main()
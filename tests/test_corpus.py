@@ -0,0 +1,48 @@
+import os
+import random
+import tempfile
+import unittest
+
+from storymaker.corpus import DRAFT_KEY_SUFFIX, CorpusIndex
+
+
+ALPHABET = "あいうえおかきくけこさしすせそたちつてとなにぬねの物語世界"
+
+
+def random_story(seed: int, length: int = 3000) -> str:
+    rng = random.Random(seed)
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+class CorpusIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.corpus = CorpusIndex(os.path.join(self.work_dir.name, "corpus.sqlite3"))
+
+    def tearDown(self):
+        self.corpus.close()
+        self.work_dir.cleanup()
+
+    def test_finds_near_duplicates_only(self):
+        story = random_story(0)
+        self.corpus.add("a", [story])
+        matches = self.corpus.query(story[:2800] + "追加の一文。" + story[2800:])
+        self.assertEqual([match.key for match in matches], ["a"])
+        self.assertEqual(self.corpus.query(random_story(1)), [])
+
+    def test_failed_draft_leaves_the_completed_story(self):
+        story = random_story(0)
+        self.corpus.add("a", [story])
+        draft = random_story(2)
+        self.assertEqual(self.corpus.add_if_unique("a" + DRAFT_KEY_SUFFIX, story, exclude_keys=("a",)), [])
+        self.corpus.remove("a" + DRAFT_KEY_SUFFIX)
+        self.assertEqual([match.key for match in self.corpus.query(story)], ["a"])
+
+        self.assertEqual(self.corpus.add_if_unique("a" + DRAFT_KEY_SUFFIX, draft, exclude_keys=("a",)), [])
+        self.corpus.add("a", [draft], replaces="a" + DRAFT_KEY_SUFFIX)
+        self.assertEqual(self.corpus.count(), 1)
+        self.assertEqual([match.key for match in self.corpus.query(draft)], ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
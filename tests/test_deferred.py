@@ -0,0 +1,49 @@
+import json
+import unittest
+
+import openai
+
+from storymaker.classmodel import DraftScores, NovelFrontmatter
+from storymaker.deferred import parse_completion, request_body
+
+
+def completion_body(message: dict, finish_reason: str = "stop") -> dict:
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "mock/frontmatter",
+        "choices": [{"index": 0, "message": {"role": "assistant", **message}, "finish_reason": finish_reason}],
+    }
+
+
+class StructuredOutputTest(unittest.TestCase):
+    def test_request_body_has_a_strict_json_schema(self):
+        body = request_body({"model": "mock", "response_format": DraftScores, "temperature": None})
+        self.assertNotIn("temperature", body)
+        json_schema = body["response_format"]["json_schema"]
+        self.assertEqual(json_schema["name"], "DraftScores")
+        self.assertTrue(json_schema["strict"])
+        self.assertFalse(json_schema["schema"]["additionalProperties"])
+        self.assertFalse(json_schema["schema"]["$defs"]["DraftScore"]["additionalProperties"])
+        self.assertEqual(json_schema["schema"]["$defs"]["DraftScore"]["required"], ["candidate", "score"])
+
+    def test_parses_content(self):
+        frontmatter = {"title": "題", "author": "作者", "synopsis": "あらすじ", "tags": ["SF", "冒険"]}
+        response = parse_completion(completion_body({"content": json.dumps(frontmatter)}), NovelFrontmatter)
+        self.assertEqual(response.choices[0].message.parsed, NovelFrontmatter(**frontmatter))
+
+    def test_refusal_is_parsed_as_none(self):
+        response = parse_completion(completion_body({"content": None, "refusal": "no"}), NovelFrontmatter)
+        self.assertIsNone(response.choices[0].message.parsed)
+        self.assertEqual(response.choices[0].message.refusal, "no")
+
+    def test_cutoffs_raise_like_the_sdk(self):
+        with self.assertRaises(openai.LengthFinishReasonError):
+            parse_completion(completion_body({"content": "{"}, "length"), NovelFrontmatter)
+        with self.assertRaises(openai.ContentFilterFinishReasonError):
+            parse_completion(completion_body({"content": None}, "content_filter"), NovelFrontmatter)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import json
+import tempfile
+import unittest
+
+from storymaker.metrics import REPORT_JSON_NAME, CallMetrics, MetricsRecorder, percentile
+
+
+class PercentileTest(unittest.TestCase):
+    def test_interpolates_between_closest_ranks(self):
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertAlmostEqual(percentile(list(range(1, 101)), 99), 99.01)
+        self.assertAlmostEqual(percentile(list(range(1, 101)), 99.9), 99.901)
+
+    def test_boundaries(self):
+        self.assertEqual(percentile([3, 1, 2], 0), 1)
+        self.assertEqual(percentile([3, 1, 2], 100), 3)
+        self.assertEqual(percentile([1, 2, 3], 0.5), 1.01)
+        self.assertEqual(percentile([5.0], 99), 5.0)
+
+    def test_rejects_out_of_range(self):
+        for q in (-1, 100.5):
+            with self.assertRaises(ValueError):
+                percentile([1, 2, 3], q)
+        with self.assertRaises(ValueError):
+            percentile([], 50)
+
+
+class MetricsRecorderTest(unittest.TestCase):
+    def test_resumed_run_appends_to_the_report(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            first = MetricsRecorder()
+            first.on_call(CallMetrics("story", "mock", 0.0, completion_tokens=100))
+            first.on_call(CallMetrics("enhance_story1", "mock", 0.0, completion_tokens=200))
+            first.write_report(output_dir)
+            resumed = MetricsRecorder()
+            resumed.on_call(CallMetrics("frontmatter", "mock", 0.0, cache_hit=True))
+            resumed.write_report(output_dir)
+
+            with open(os.path.join(output_dir, REPORT_JSON_NAME), "r", encoding="utf-8") as f:
+                report = json.load(f)
+            self.assertEqual([call["step"] for call in report["calls"]], ["story", "enhance_story1", "frontmatter"])
+            self.assertEqual(report["summary"]["story"]["completion_tokens"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()